@@ -0,0 +1,234 @@
+"""
+Ответы на команды пользователей в Telegram.
+Команды /status и /history отвечают из кэша последних известных работ
+по токену. Кэш пополняется основным циклом опроса, а к API обращается
+только тогда, когда данные старше ttl; одновременные запросы по одному
+токену объединяются в один вызов API.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+HELP = ('Доступные команды:\n'
+        '/status - текущий статус последней работы\n'
+        '/history - статусы последних работ')
+NO_DATA = 'Работы на проверке пока не найдены.'
+API_ERROR = 'Не удалось получить данные от API, попробуйте позже.'
+
+
+def homework_id(homework):
+    """Идентификатор работы для объединения ответов API."""
+    return homework.get('id', homework.get('homework_name'))
+
+
+class FetchDeferred(Exception):
+    """Запрос к API отложен: лимит запросов исчерпан или токен в паузе."""
+
+
+class CacheEntry:
+    """Последние известные работы одного токена."""
+
+    __slots__ = ('homeworks', 'refreshed', 'complete', 'error', 'failed',
+                 'lock')
+
+    def __init__(self):
+        self.homeworks = {}
+        self.refreshed = None
+        self.complete = False
+        self.error = None
+        self.failed = None
+        self.lock = threading.Lock()
+
+
+class StatusCache:
+    """
+    Кэш работ по токенам с коротким временем жизни.
+    fetch(token) должна возвращать полный список работ токена
+    (результат check_response). Результаты основного цикла передаются
+    в observe() и продлевают жизнь кэша, если в нем уже есть полный
+    список: цикл видит все изменения статусов.
+    """
+
+    def __init__(self, fetch, ttl=60, clock=time.monotonic):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def entry(self, token):
+        """Запись токена; создается при первом обращении."""
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry is None:
+                entry = self.entries[token] = CacheEntry()
+            return entry
+
+    def remember(self, token, homeworks, complete=False):
+        """Учет полученных работ токена."""
+        entry = self.entry(token)
+        with self.lock:
+            if homeworks:
+                # Новый словарь вместо изменения старого: команды
+                # читают работы без блокировки.
+                merged = dict(entry.homeworks)
+                for homework in homeworks:
+                    merged[homework_id(homework)] = homework
+                entry.homeworks = merged
+            entry.complete = entry.complete or complete
+            if entry.complete:
+                entry.refreshed = self.clock()
+                entry.error = None
+
+    def observe(self, snapshot):
+        """Учет снимка опроса (subscriptions.TokenSnapshot)."""
+        if snapshot.error is None:
+            self.remember(snapshot.token, snapshot.homeworks)
+        return snapshot
+
+    def is_fresh(self, entry, now):
+        """Данные записи или ее последняя ошибка моложе ttl."""
+        if entry.failed is not None and now - entry.failed < self.ttl:
+            return True
+        return (entry.refreshed is not None
+                and now - entry.refreshed < self.ttl)
+
+    def homeworks(self, token):
+        """
+        Работы токена, от последних измененных к более ранним.
+        Устаревший кэш обновляется одним запросом к API: остальные
+        вызовы ждут его результата. Ошибка API запоминается на ttl,
+        поэтому серия команд при недоступном API тоже дает один запрос;
+        тогда отдаются уже известные работы: полный список или работы
+        из результатов опроса.
+        """
+        entry = self.entry(token)
+        if not self.is_fresh(entry, self.clock()):
+            with entry.lock:
+                if not self.is_fresh(entry, self.clock()):
+                    self.refresh(token, entry)
+        # При ошибке API известные, пусть и устаревшие или неполные,
+        # работы лучше отказа.
+        if entry.error is not None and not entry.homeworks:
+            raise entry.error
+        return sorted(entry.homeworks.values(),
+                      key=lambda homework: homework.get('date_updated') or '',
+                      reverse=True)
+
+    def refresh(self, token, entry):
+        """Запрос полного списка работ токена."""
+        try:
+            homeworks = self.fetch(token)
+        except Exception as error:
+            entry.error = error
+            entry.failed = self.clock()
+            return
+        entry.failed = None
+        self.remember(token, homeworks, complete=True)
+
+
+class CommandHandler:
+    """
+    Разбор команд и подготовка ответов.
+    tokens - словарь {chat_id: токены подписок чата}; чатам без
+    подписки бот не отвечает. render(homework) - строка о работе.
+    """
+
+    def __init__(self, cache, tokens, render, history_limit=10):
+        self.cache = cache
+        self.tokens = {str(chat_id): chat_tokens
+                       for chat_id, chat_tokens in tokens.items()}
+        self.render = render
+        self.history_limit = history_limit
+        self.commands = {'/status': 1, '/history': history_limit}
+
+    def handle(self, chat_id, text):
+        """Ответ на сообщение или None, если отвечать не нужно."""
+        tokens = self.tokens.get(str(chat_id))
+        if not tokens or not text or not text.startswith('/'):
+            return None
+        # '/status@bot_name аргументы' -> '/status'
+        command = text.split()[0].split('@')[0].lower()
+        limit = self.commands.get(command)
+        if limit is None:
+            return HELP
+        lines = []
+        for token in tokens:
+            try:
+                homeworks = self.cache.homeworks(token)
+            except Exception as error:
+                logger.error(f'Команда {command}: {error}')
+                return API_ERROR
+            lines.extend(self.render(homework)
+                         for homework in homeworks[:limit])
+        return '\n'.join(lines) or NO_DATA
+
+
+class UpdateListener:
+    """
+    Получение команд через long polling getUpdates.
+    Команды обрабатываются пулом потоков, поэтому медленный запрос
+    к API по одному токену не задерживает ответы по остальным.
+    reply(chat_id, text) отправляет ответ.
+    """
+
+    def __init__(self, bot, handler, reply, timeout=30, workers=4,
+                 backoff=5):
+        self.bot = bot
+        self.handler = handler
+        self.reply = reply
+        self.timeout = timeout
+        self.backoff = backoff
+        self.offset = None
+        self.stopped = threading.Event()
+        self.thread = None
+        self.pool = ThreadPoolExecutor(max_workers=workers,
+                                       thread_name_prefix='command')
+
+    def answer(self, chat_id, text):
+        """Подготовка и отправка ответа на одно сообщение."""
+        try:
+            reply = self.handler.handle(chat_id, text)
+            if reply is not None:
+                self.reply(chat_id, reply)
+        except Exception as error:
+            logger.error(f'Не удалось ответить на команду: {error}')
+
+    def poll(self):
+        """Один запрос обновлений; возвращает число сообщений."""
+        updates = self.bot.get_updates(offset=self.offset,
+                                       timeout=self.timeout,
+                                       allowed_updates=['message'])
+        count = 0
+        for update in updates:
+            self.offset = update.update_id + 1
+            message = update.message
+            if message is None or not message.text:
+                continue
+            self.pool.submit(self.answer, message.chat_id, message.text)
+            count += 1
+        return count
+
+    def run(self):
+        """Получение обновлений до остановки."""
+        while not self.stopped.is_set():
+            try:
+                self.poll()
+            except Exception as error:
+                logger.error(f'Не удалось получить обновления: {error}')
+                self.stopped.wait(self.backoff)
+
+    def start(self):
+        """Запуск получения команд в фоновом потоке."""
+        self.thread = threading.Thread(target=self.run, name='commands',
+                                       daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self):
+        """Остановка после текущего запроса обновлений."""
+        self.stopped.set()
+        self.pool.shutdown(wait=False)
@@ -0,0 +1,145 @@
+"""
+Параллельная доставка сообщений в несколько чатов.
+Одно готовое сообщение рассылается в N чатов через общий пул потоков,
+а ограничитель частоты канала не дает превысить его лимиты.
+"""
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+
+class RateLimiter:
+    """
+    Потокобезопасный ограничитель частоты (token bucket).
+    Допускает не более rate вызовов в секунду с запасом burst.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(self.burst)
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        """Пополнение запаса; вызывается под блокировкой."""
+        now = self.clock()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Резервирование вызова; возвращает необходимое ожидание."""
+        with self.lock:
+            self.refill()
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def try_acquire(self):
+        """Вызов без ожидания: True, если лимит его допускает."""
+        with self.lock:
+            self.refill()
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def wait_time(self):
+        """Время до появления разрешения на вызов, в секундах."""
+        with self.lock:
+            self.refill()
+            return max(0, (1 - self.tokens) / self.rate)
+
+    def acquire(self):
+        """Ожидание разрешения на вызов."""
+        delay = self.reserve()
+        if delay:
+            self.sleep(delay)
+
+
+@dataclass
+class DeliveryResult:
+    """Итог рассылки одного сообщения по чатам."""
+
+    message: str
+    delivered: List = field(default_factory=list)
+    failed: Dict = field(default_factory=dict)
+
+    def __bool__(self):
+        """Сообщение доставлено во все чаты."""
+        return not self.failed
+
+
+class DeliveryExecutor:
+    """
+    Общее ядро доставки для всех каналов уведомлений.
+    Чаты делятся на пачки по notifier.batch_size, пачки отправляются
+    параллельно через пул потоков с повторами и экспоненциальной
+    паузой, а результат собирается в DeliveryResult по каждому чату.
+    """
+
+    def __init__(self, notifier, max_workers=8, retries=2, backoff=0.5,
+                 sleep=time.sleep):
+        self.notifier = notifier
+        self.retries = retries
+        self.backoff = backoff
+        self.sleep = sleep
+        self.pool = ThreadPoolExecutor(max_workers=max_workers,
+                                       thread_name_prefix='delivery')
+
+    def send_batch(self, batch, message):
+        """Отправка пачки с учетом лимита частоты и повторами."""
+        items = [(chat_id, message) for chat_id in batch]
+        rate_limiter = self.notifier.rate_limiter
+        for attempt in range(self.retries + 1):
+            if rate_limiter is not None:
+                for _ in items:
+                    rate_limiter.acquire()
+            try:
+                self.notifier.send_batch(items)
+                return
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                self.sleep(self.backoff * 2 ** attempt)
+
+    def deliver(self, message, chat_ids):
+        """
+        Рассылка сообщения в указанные чаты.
+        Единственная пачка обслуживается в текущем потоке без пула.
+        """
+        chat_ids = tuple(chat_ids)
+        size = self.notifier.batch_size
+        batches = [chat_ids[start:start + size]
+                   for start in range(0, len(chat_ids), size)]
+        if len(batches) == 1:
+            calls = {batches[0]: functools.partial(self.send_batch,
+                                                   batches[0], message)}
+        else:
+            calls = {
+                batch: self.pool.submit(self.send_batch, batch,
+                                        message).result
+                for batch in batches
+            }
+        result = DeliveryResult(message)
+        for batch, call in calls.items():
+            try:
+                call()
+            except Exception as error:
+                result.failed.update(dict.fromkeys(batch, error))
+            else:
+                result.delivered.extend(batch)
+        return result
+
+    def shutdown(self):
+        """Остановка пула потоков и закрытие канала."""
+        self.pool.shutdown(wait=True)
+        self.notifier.close()
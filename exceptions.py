@@ -1,69 +1,104 @@
-from dataclasses import dataclass
+import logging
+from enum import IntEnum
 
 
-@dataclass
-class NotFoundError(Exception):
+class ErrorCode(IntEnum):
+    '''
+    Стабильные коды ошибок бота.
+    Значения не меняются между версиями: по ним main() решает,
+    уведомлять ли пользователя, и они же попадают в логи.
+    '''
+    NOT_FOUND = 1
+    RESPONSE_TYPE = 2
+    RESPONSE_VALUE = 3
+    NOT_LIST = 4
+    MISSING_KEY = 5
+    UNKNOWN_STATUS = 6
+    NO_UPDATES = 7
+    UNAUTHORIZED = 8
+
+
+class BotError(Exception):
+    '''
+    Базовый класс ошибок бота.
+    Хранит текст ошибки и заранее сформированное сообщение
+    для пользователя; код и уровень логирования задаются классом.
+    '''
+    code = None
+    level = logging.ERROR
+    template = 'В результате работы бота возникла ошибка: {}'
+
+    def __init__(self, text):
+        super().__init__(text)
+        self.text = text
+        self.message = self.template.format(text)
+
+    def __str__(self):
+        return self.text
+
+
+class NotFoundError(BotError):
     '''
     Класс для обработки исключений в случае,
     если url недоступен.
     '''
+    code = ErrorCode.NOT_FOUND
+
 
-    txt: str
+class UnauthorizedError(NotFoundError):
+    '''
+    Класс для обработки исключений в случае,
+    если API отклонил токен Практикума (401/403).
+    '''
+    code = ErrorCode.UNAUTHORIZED
 
 
-class ResponseTypeError(TypeError):
+class ResponseTypeError(BotError, TypeError):
     '''
     Класс для обработки исключений в случае,
     если объект response не является словарем.
     '''
-    def __init__(self, text):
-        super().__init__()
-        self.text = text
+    code = ErrorCode.RESPONSE_TYPE
 
 
-@dataclass
-class ResponseValueError(Exception):
+class ResponseValueError(BotError):
     '''
     Класс для обработки исключений в случае,
     если response не содержит данных
     '''
-    txt: str
+    code = ErrorCode.RESPONSE_VALUE
 
 
-@dataclass
-class NotListResultError(Exception):
+class NotListResultError(BotError):
     '''
     Класс для обработки исключений в случае,
     если check_response не является списком.
     '''
-    txt: str
+    code = ErrorCode.NOT_LIST
 
 
-class CustomKeyError(KeyError):
+class CustomKeyError(BotError, KeyError):
     '''
     Класс для обработки исключений в случае,
     если ключ отсутствует в словаре.
     '''
-    def __init__(self, text):
-        super().__init__()
-        self.text = text
+    code = ErrorCode.MISSING_KEY
 
 
-class StatusError(KeyError):
+class StatusError(BotError, KeyError):
     '''
     Класс для обработки исключений в случае,
     если название домашней работы отсутствует
     в списке ключей словаря.
     '''
-    def __init__(self, text):
-        super().__init__()
-        self.text = text
+    code = ErrorCode.UNKNOWN_STATUS
 
 
-@dataclass
-class UpdateError(Exception):
+class UpdateError(BotError):
     '''
     Класс для обработки ошибки, возникающей
     при получении пустого списка в ответе
     '''
-    txt: str
+    code = ErrorCode.NO_UPDATES
+    level = logging.DEBUG
+    template = '{}'
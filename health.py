@@ -0,0 +1,149 @@
+"""
+Контроль работоспособности бота.
+Сторожевой поток следит за временем с момента последнего цикла,
+успешного запроса к API и успешной отправки сообщения, а локальный
+HTTP-сервер отдает эти данные по адресам /healthz и /readyz.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+def restart_process():
+    """Перезапуск процесса бота с теми же аргументами."""
+    logging.shutdown()
+    os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+class Watchdog:
+    """
+    Учет задержек основного цикла.
+    Отметки 'cycle' ставит основной цикл, 'poll' и 'send' - успешные
+    запрос к API и отправка сообщения. Если цикл не отмечался дольше
+    max_lag секунд, бот считается зависшим.
+    """
+
+    MARKS = ('cycle', 'poll', 'send')
+
+    def __init__(self, max_lag, restart=False, clock=time.monotonic):
+        self.max_lag = max_lag
+        self.restart = restart
+        self.clock = clock
+        self.started = clock()
+        self.marks = dict.fromkeys(self.MARKS)
+        self.thread = None
+
+    def beat(self, mark):
+        """Отметка об успешном выполнении этапа."""
+        self.marks[mark] = self.clock()
+
+    def lag(self, mark):
+        """Время в секундах с последней отметки или с момента запуска."""
+        last = self.marks[mark]
+        return self.clock() - (self.started if last is None else last)
+
+    def is_stuck(self):
+        """Основной цикл не отмечался дольше допустимого."""
+        return self.lag('cycle') > self.max_lag
+
+    def is_ready(self):
+        """Цикл работает и запросы к API проходят успешно."""
+        return not self.is_stuck() and self.lag('poll') <= self.max_lag
+
+    def is_alive(self):
+        """Сторожевой поток запущен и основной цикл не завис."""
+        return (self.thread is not None and self.thread.is_alive()
+                and not self.is_stuck())
+
+    def status(self):
+        """Состояние для ответа HTTP-сервера."""
+        return {
+            'alive': self.is_alive(),
+            'stuck': self.is_stuck(),
+            'ready': self.is_ready(),
+            'max_lag': self.max_lag,
+            'lag': {mark: round(self.lag(mark), 3) for mark in self.MARKS},
+        }
+
+    def check(self):
+        """Проверка задержки цикла и перезапуск при зависании."""
+        if not self.is_stuck():
+            return
+        logger.critical('Основной цикл не отвечает '
+                        f'{self.lag("cycle"):.0f} с.')
+        if self.restart:
+            logger.critical('Перезапуск бота...')
+            restart_process()
+
+    def watch(self, interval):
+        """Периодическая проверка задержки цикла."""
+        while True:
+            time.sleep(interval)
+            self.check()
+
+    def start(self, interval=10):
+        """Запуск сторожевого потока."""
+        self.thread = threading.Thread(target=self.watch, args=(interval,),
+                                       name='watchdog', daemon=True)
+        self.thread.start()
+        return self.thread
+
+
+class HealthHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов /healthz и /readyz."""
+
+    watchdog = None
+    routes = {}
+
+    def do_GET(self):
+        """Ответ с состоянием сторожевого потока."""
+        status = self.watchdog.status()
+        if self.path == '/healthz':
+            ok = status['alive']
+        elif self.path == '/readyz':
+            ok = status['ready']
+        elif self.path in self.routes:
+            ok, status = True, self.routes[self.path]()
+        else:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        body = json.dumps(status).encode()
+        self.send_response(
+            HTTPStatus.OK if ok else HTTPStatus.SERVICE_UNAVAILABLE
+        )
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Запросы проверок пишутся в отладочный лог."""
+        logger.debug(format % args)
+
+
+def create_health_server(watchdog, host, port, routes=None):
+    """
+    HTTP-сервер проверок без запуска.
+    routes - дополнительные адреса для самодиагностики вида
+    {'/path': функция, возвращающая данные для JSON}.
+    """
+    handler = type('BoundHealthHandler', (HealthHandler,),
+                   {'watchdog': watchdog, 'routes': routes or {}})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve_health(watchdog, host, port, routes=None):
+    """Запуск HTTP-сервера проверок в фоновом потоке."""
+    server = create_health_server(watchdog, host, port, routes)
+    threading.Thread(target=server.serve_forever, name='health',
+                     daemon=True).start()
+    return server
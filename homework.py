@@ -1,16 +1,35 @@
+import functools
 import logging
 import os
 import sys
+import threading
 import time
+from contextlib import nullcontext
 from http import HTTPStatus
+from types import SimpleNamespace
 
 import requests
 import telegram
 from dotenv import load_dotenv
+from telegram.utils.request import Request
 
-from exceptions import (CustomKeyError, NotFoundError, NotListResultError,
-                        ResponseTypeError, ResponseValueError, StatusError,
+from commands import (CommandHandler, FetchDeferred, StatusCache,
+                      UpdateListener)
+from delivery import DeliveryExecutor, RateLimiter
+from exceptions import (BotError, CustomKeyError, ErrorCode, NotFoundError,
+                        NotListResultError, ResponseTypeError,
+                        ResponseValueError, StatusError, UnauthorizedError,
                         UpdateError)
+from health import Watchdog, create_health_server
+from isolation import IsolatedPoller
+from notifiers import (FileNotifier, StreamNotifier, TelegramNotifier,
+                       WebhookNotifier)
+from outbox import Outbox
+from profiling import CycleProfiler
+from runner import Component, DeliveryWorker, Runtime
+from scheduler import PollScheduler
+from subscriptions import TokenFanOut, load_subscriptions
+from watermark import WatermarkManager
 
 load_dotenv()
 
@@ -27,8 +46,83 @@ logger.addHandler(handler)
 PRACTICUM_TOKEN = os.getenv('PRACTICUM_TOKEN')
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('CHAT_ID')
+# Дополнительные подписки вида 'token1:chat1,chat2;token2:chat3'.
+# Если переменная не задана, используется пара PRACTICUM_TOKEN и CHAT_ID.
+SUBSCRIPTIONS = os.getenv('SUBSCRIPTIONS')
 
 RETRY_TIME = 300
+# Таймаут запросов к API и Telegram, в секундах.
+REQUEST_TIMEOUT = int(os.getenv('REQUEST_TIMEOUT', 30))
+# Канал уведомлений: telegram, webhook (WEBHOOK_URL), file (NOTIFY_FILE)
+# или stdout; другое значение - ошибка запуска.
+NOTIFIERS = ('telegram', 'webhook', 'file', 'stdout')
+NOTIFIER = os.getenv('NOTIFIER', 'telegram')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+NOTIFY_FILE = os.getenv('NOTIFY_FILE', 'notifications.jsonl')
+# Число потоков и повторов рассылки, общий лимит сообщений Telegram
+# в секунду (0 отключает ограничение).
+DELIVERY_WORKERS = int(os.getenv('DELIVERY_WORKERS', 8))
+DELIVERY_RETRIES = int(os.getenv('DELIVERY_RETRIES', 2))
+TELEGRAM_RATE_LIMIT = float(os.getenv('TELEGRAM_RATE_LIMIT', 30))
+# Адрес сервера проверок /healthz и /readyz; пустой порт отключает сервер,
+# а занятый порт только логируется.
+HEALTH_HOST = os.getenv('HEALTH_HOST', '127.0.0.1')
+HEALTH_PORT = os.getenv('HEALTH_PORT', '8080')
+# Допустимая задержка основного цикла и перезапуск бота при ее превышении.
+WATCHDOG_MAX_LAG = int(os.getenv('WATCHDOG_MAX_LAG', 3 * RETRY_TIME))
+WATCHDOG_RESTART = os.getenv('WATCHDOG_RESTART', '').lower() in ('1', 'true')
+# Профилирование этапов цикла; профиль выгружается по сигналу SIGUSR1.
+PROFILE = os.getenv('PROFILE', '').lower() in ('1', 'true')
+PROFILE_SAMPLE_EVERY = int(os.getenv('PROFILE_SAMPLE_EVERY', 10))
+PROFILE_DIR = os.getenv('PROFILE_DIR', '.')
+# Интервалы опроса подписок по их активности, в секундах, и общий
+# лимит запросов к API в минуту (0 отключает ограничение). По умолчанию
+# лимит равен прежней частоте: один запрос на токен за RETRY_TIME, а
+# частые интервалы лишь перераспределяют его между подписками.
+POLL_INTERVALS = {
+    'reviewing': int(os.getenv('POLL_INTERVAL_REVIEWING', 60)),
+    'recent': int(os.getenv('POLL_INTERVAL_RECENT', 120)),
+    'error': int(os.getenv('POLL_INTERVAL_ERROR', 180)),
+    'idle': int(os.getenv('POLL_INTERVAL_IDLE', RETRY_TIME)),
+}
+API_REQUESTS_PER_MINUTE = (int(os.environ['API_REQUESTS_PER_MINUTE'])
+                           if os.getenv('API_REQUESTS_PER_MINUTE') else None)
+# Изоляция подписок: потоки опроса, таймаут опроса токена, сколько
+# секунд цикл ждет результатов, отказов API до карантина, базовая пауза
+# после сбоя и длительность карантина.
+POLL_WORKERS = int(os.getenv('POLL_WORKERS', 8))
+POLL_TIMEOUT = int(os.getenv('POLL_TIMEOUT', 2 * REQUEST_TIMEOUT))
+POLL_COLLECT_TIME = float(os.getenv('POLL_COLLECT_TIME', 1))
+ERROR_BUDGET = int(os.getenv('ERROR_BUDGET', 5))
+ERROR_BACKOFF = int(os.getenv('ERROR_BACKOFF', 60))
+QUARANTINE_TIME = int(os.getenv('QUARANTINE_TIME', 3600))
+# Перекрытие окон запроса к API, в секундах.
+WATERMARK_OVERLAP = int(os.getenv('WATERMARK_OVERLAP', RETRY_TIME))
+# Журнал исходящих сообщений (SQLite): число попыток доставки записи,
+# начальная и наибольшая пауза между попытками, возраст, после которого
+# запись больше не повторяется, и срок хранения завершенных записей,
+# в секундах. По умолчанию попытки растягиваются примерно на 14 часов.
+OUTBOX_PATH = os.getenv('OUTBOX_PATH', 'outbox.sqlite3')
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 20))
+OUTBOX_RETRY_BACKOFF = int(os.getenv('OUTBOX_RETRY_BACKOFF', 60))
+OUTBOX_MAX_BACKOFF = int(os.getenv('OUTBOX_MAX_BACKOFF', 3600))
+OUTBOX_MAX_AGE = int(os.getenv('OUTBOX_MAX_AGE', 24 * 3600))
+OUTBOX_RETENTION = int(os.getenv('OUTBOX_RETENTION', 24 * 3600))
+# Ответы на команды /status и /history: включение, время жизни кэша
+# работ в секундах, число работ в ответе /history и потоков ответов,
+# отдельный от опроса лимит запросов команд к API в минуту (0 отключает
+# ограничение): опрос расходует свой лимит целиком.
+COMMANDS = os.getenv('COMMANDS', '').lower() in ('1', 'true')
+COMMAND_CACHE_TTL = int(os.getenv('COMMAND_CACHE_TTL', 60))
+COMMAND_HISTORY_LIMIT = int(os.getenv('COMMAND_HISTORY_LIMIT', 10))
+COMMAND_WORKERS = int(os.getenv('COMMAND_WORKERS', 4))
+COMMAND_REQUESTS_PER_MINUTE = int(os.getenv('COMMAND_REQUESTS_PER_MINUTE',
+                                            2))
+# Работа компонентами в одном процессе (см. Procfile): размер очереди
+# доставки и период сохранения состояния подписок, в секундах.
+RUNNER = os.getenv('RUNNER', '').lower() in ('1', 'true')
+DELIVERY_QUEUE_SIZE = int(os.getenv('DELIVERY_QUEUE_SIZE', 100))
+CHECKPOINT_INTERVAL = int(os.getenv('CHECKPOINT_INTERVAL', 60))
 ENDPOINT = 'https://practicum.yandex.ru/api/user_api/homework_statuses/'
 HEADERS = {'Authorization': f'OAuth {PRACTICUM_TOKEN}'}
 
@@ -40,28 +134,42 @@ HOMEWORK_VERDICTS = {
 }
 
 # В переменной EXCEPTIONS будет содержаться информация об ошибках,
-# возникающих во время работы бота.
+# возникающих во время работы бота, отдельно по каждому токену.
 # Каждая отдельная ошибка будет проверяться в обработчике на дублирование.
 # Если ошибка не была устранена и она возникает снова, сообщение о ней не
-# будет отправлено пользователю, пока не случится успешный вызов функции, из
-# которой она была вызвана
-EXCEPTIONS = {
-    'NotFoundError': False,
-    'ResponseTypeError': False,
-    'ResponseValueError': False,
-    'CustomKeyError': False,
-    'NotListResultError': False,
-    'KeyError': False,
-    'UpdateError': False
+# будет отправлено пользователю, пока токен не пройдет успешно этап опроса,
+# на котором она возникла. Вид: {токен: {код из ErrorCode: bool}}.
+EXCEPTIONS = {}
+
+# Этапы опроса токена, на которых возникают ошибки: 0 - запрос к API,
+# 1 - проверка ответа, 2 - разбор статуса работы.
+ERROR_STAGES = {
+    ErrorCode.NOT_FOUND: 0,
+    ErrorCode.UNAUTHORIZED: 0,
+    ErrorCode.RESPONSE_TYPE: 1,
+    ErrorCode.RESPONSE_VALUE: 1,
+    ErrorCode.MISSING_KEY: 1,
+    ErrorCode.NOT_LIST: 1,
+    ErrorCode.UNKNOWN_STATUS: 2,
+    ErrorCode.NO_UPDATES: 2,
 }
 
+# Сообщение об отсутствии обновлений одинаково для всех токенов,
+# поэтому объект ошибки создается один раз.
+NO_UPDATES = UpdateError('На данный момент нет обновлений.')
 
-def send_message(bot, message: str):
-    """Отправляет пользователю текстовое сообщение."""
+WATCHDOG = Watchdog(WATCHDOG_MAX_LAG, restart=WATCHDOG_RESTART)
+PROFILER = CycleProfiler(PROFILE, PROFILE_SAMPLE_EVERY, PROFILE_DIR)
+
+
+def send_chat_message(bot, chat_id, message: str):
+    """Отправляет текстовое сообщение в указанный чат."""
     try:
         logger.debug('Попытка отправить сообщение.')
-        bot.send_message(chat_id=TELEGRAM_CHAT_ID,
-                         text=message)
+        bot.send_message(chat_id=chat_id,
+                         text=message,
+                         timeout=REQUEST_TIMEOUT)
+        WATCHDOG.beat('send')
         logger.debug('Сообщение успешно отправлено!')
         return True
     except Exception:
@@ -69,29 +177,61 @@ def send_message(bot, message: str):
         return False
 
 
-def get_api_answer(current_timestamp):
+def send_message(bot, message: str):
+    """Отправляет пользователю текстовое сообщение."""
+    return send_chat_message(bot, TELEGRAM_CHAT_ID, message)
+
+
+def fetch_api(headers, current_timestamp):
     """
-    Получение данных от API.
-    Функция обращается к API-сервису и возвращает информацию
-    о статусе домашней работы.
+    Запрос к API-сервису с указанными заголовками авторизации.
+    В отличие от request_api не отмечает опрос в сторожевом таймере.
     """
-    timestamp = current_timestamp or int(time.time())
+    timestamp = (int(time.time()) if current_timestamp is None
+                 else current_timestamp)
     params = {'from_date': timestamp}
     try:
         logger.debug('Попытка получить данные из API...')
-        response = requests.get(ENDPOINT,
-                                headers=HEADERS,
-                                params=params
-                                )
-        if response.status_code != HTTPStatus.OK:
-            logger.error(f'Сервер недоступен {response.status_code}')
-            raise NotFoundError('Не удалось подключиться к API.')
+        with PROFILER.span('http'):
+            response = requests.get(ENDPOINT,
+                                    headers=headers,
+                                    params=params,
+                                    timeout=REQUEST_TIMEOUT
+                                    )
     except Exception:
         raise NotFoundError('Не удалось подключиться к API.')
-    # Сбрасываем ошибку подключения к API, если она была ранее:
-    EXCEPTIONS['NotFoundError'] = False
+    if response.status_code in (HTTPStatus.UNAUTHORIZED,
+                                HTTPStatus.FORBIDDEN):
+        logger.error(f'Токен отклонен API {response.status_code}')
+        raise UnauthorizedError('Токен Практикума отклонен API.')
+    if response.status_code != HTTPStatus.OK:
+        logger.error(f'Сервер недоступен {response.status_code}')
+        raise NotFoundError('Не удалось подключиться к API.')
     logger.debug('Запрос к API успешно выполнен.')
-    return response.json()
+    with PROFILER.span('json'):
+        return response.json()
+
+
+def request_api(headers, current_timestamp):
+    """Запрос к API-сервису в основном цикле опроса."""
+    response = fetch_api(headers, current_timestamp)
+    WATCHDOG.beat('poll')
+    return response
+
+
+def get_api_answer(current_timestamp):
+    """
+    Получение данных от API.
+    Функция обращается к API-сервису и возвращает информацию
+    о статусе домашней работы.
+    """
+    return request_api(HEADERS, current_timestamp)
+
+
+def get_token_api_answer(token, current_timestamp):
+    """Получение данных от API от имени указанного токена Практикума."""
+    return request_api({'Authorization': f'OAuth {token}'},
+                       current_timestamp)
 
 
 def check_response(response):
@@ -106,16 +246,11 @@ def check_response(response):
         raise ResponseTypeError('Запрос к API вернул не то, что ожидалось')
     if not response.keys():
         raise ResponseValueError('Объект response не содержит данных')
-    # Сбрасываем возможные ошибки, если они были ранее:
-    EXCEPTIONS['ResponseTypeError'] = False
-    EXCEPTIONS['ResponseValueError'] = False
     homework = response.get('homeworks')
     if homework is None:
-        raise KeyError('Ответ от API не содержит ключа "homeworks".')
+        raise CustomKeyError('Ответ от API не содержит ключа "homeworks".')
     if not isinstance(homework, list):
         raise NotListResultError('Объект "homework" не является списком')
-    # Сбрасываем возможную ошибку несоответствия типа данных классу list:
-    EXCEPTIONS['NotListResultError'] = False
     logger.debug('Данные успешно обработаны.')
     return homework
 
@@ -127,12 +262,8 @@ def parse_status(homework):
     домашнего задания
     """
     logger.debug('Получение данных о названии и статусе домашней работы...')
-    # Сбрасываем ошибку, если ранее статус отсутствовал в словаре:
-    EXCEPTIONS['UpdateError'] = False
     homework_name = homework.get('homework_name')
     homework_status = homework.get('status')
-    # Сбрасываем ошибку, если ранее статус отсутствовал в словаре:
-    EXCEPTIONS['StatusError'] = False
     if homework_status not in HOMEWORK_VERDICTS.keys():
         raise StatusError('В словаре документированных статусов отсутствует '
                           f'статус {homework_status}')
@@ -142,6 +273,28 @@ def parse_status(homework):
     return f'Изменился статус проверки работы "{homework_name}". {verdict}'
 
 
+def get_homeworks(token, budget=None, poller=None):
+    """
+    Полный список работ токена для ответов на команды.
+    Запрос не влияет на состояние опроса: не отмечается в сторожевом
+    таймере и не меняет флаги ошибок. Он расходует лимит запросов
+    команд к API (budget) и не выполняется для токена в паузе после
+    сбоя или в карантине (poller); тогда - исключение FetchDeferred.
+    """
+    if poller is not None and not poller.is_ready(token):
+        raise FetchDeferred('Токен в паузе после сбоя или в карантине.')
+    if budget is not None and not budget.try_acquire():
+        raise FetchDeferred('Лимит запросов к API исчерпан.')
+    return check_response(fetch_api({'Authorization': f'OAuth {token}'}, 0))
+
+
+def format_homework(homework):
+    """Строка о текущем статусе работы для ответов на команды."""
+    status = homework.get('status')
+    verdict = HOMEWORK_VERDICTS.get(status, f'Статус {status}.')
+    return f'"{homework.get("homework_name")}": {verdict}'
+
+
 def check_tokens():
     """Функция проверяет доступность переменных окружения."""
     logger.debug('Проверка переменных окружения...')
@@ -157,50 +310,500 @@ def check_tokens():
     return True
 
 
+def deliver(delivery, chat_ids, message):
+    """
+    Рассылка сообщения во все чаты подписки.
+    Возвращает delivery.DeliveryResult: он истинен, если сообщение
+    доставлено во все чаты.
+    """
+    with PROFILER.span('send'):
+        result = delivery.deliver(message, chat_ids)
+    if result.delivered:
+        WATCHDOG.beat('send')
+    for chat_id, error in result.failed.items():
+        logger.error(f'Невозможно отправить сообщение в чат {chat_id}: '
+                     f'{error}')
+    return result
+
+
+def deliver_entries(delivery, outbox, entries):
+    """
+    Рассылка записей журнала и отметка результатов.
+    entries - список (id, chat_id, text); записи с одинаковым текстом
+    рассылаются одним вызовом, а результаты всех записей фиксируются
+    в журнале одной транзакцией.
+    """
+    groups = {}
+    for entry_id, chat_id, text in entries:
+        groups.setdefault(text, {}).setdefault(chat_id, []).append(entry_id)
+    delivered, failed = [], []
+    for text, ids in groups.items():
+        result = deliver(delivery, list(ids), text)
+        for chat_id in result.delivered:
+            delivered.extend(ids[chat_id])
+        for chat_id in result.failed:
+            failed.extend(ids[chat_id])
+    outbox.complete(delivered, failed)
+    return not failed
+
+
+def replay_outbox(delivery, outbox):
+    """Повторная рассылка недоставленных записей журнала."""
+    entries = outbox.pending()
+    if entries:
+        logger.info(f'Повторная отправка сообщений из журнала: '
+                    f'{len(entries)}')
+        deliver_entries(delivery, outbox, entries)
+
+
+def error_flags(token):
+    """Флаги отправленных уведомлений об ошибках токена."""
+    flags = EXCEPTIONS.get(token)
+    if flags is None:
+        flags = EXCEPTIONS[token] = dict.fromkeys(ErrorCode, False)
+    return flags
+
+
+def reset_errors(token, passed=None):
+    """
+    Сброс флагов ошибок этапов, которые токен прошел успешно.
+    passed - число пройденных этапов опроса (см. ERROR_STAGES),
+    None - все этапы.
+    """
+    flags = error_flags(token)
+    for code, stage in ERROR_STAGES.items():
+        if passed is None or stage < passed:
+            flags[code] = False
+
+
+def handle_error(delivery, token, chat_ids, error, notify=None):
+    """
+    Обработка ошибки, возникшей при опросе токена.
+    Ошибки бота различаются по коду: о каждой чаты токена уведомляются
+    однократно, пока токен не пройдет успешно этап, на котором она
+    возникла. Прочие исключения только логируются. notify(chat_ids,
+    message) заменяет немедленную рассылку и возвращает True, если
+    уведомление принято к доставке.
+    """
+    if not isinstance(error, BotError):
+        logger.error('В результате работы бота возникла '
+                     f'ошибка: {type(error).__name__}: {error}')
+        return
+    logger.log(error.level, f'[{error.code:d}] {type(error).__name__}: '
+                            f'{error.text}')
+    reset_errors(token, ERROR_STAGES[error.code])
+    flags = error_flags(token)
+    if not flags[error.code]:
+        if notify is None:
+            notify = functools.partial(deliver, delivery)
+        flags[error.code] = bool(notify(chat_ids, error.message))
+
+
+def publish_snapshot(delivery, outbox, watermarks, chat_ids, snapshot,
+                     publish=None, state_lock=nullcontext()):
+    """
+    Запись сообщений снимка вместе с отметкой токена.
+    Сообщения и отметка попадают в журнал одной транзакцией под
+    state_lock; рассылка идет уже без него.
+    """
+    entries = ()
+    with state_lock:
+        watermarks.commit(snapshot.token, snapshot.homeworks,
+                          snapshot.current_date)
+        state = {snapshot.token: watermarks.dump(snapshot.token)}
+        if publish is None:
+            entries = outbox.append(chat_ids, snapshot.messages, state)
+        else:
+            publish(chat_ids, snapshot.messages, state)
+    if entries:
+        deliver_entries(delivery, outbox, entries)
+
+
+def process_cycle(delivery, fan_out, watermarks, scheduler, poller, outbox,
+                  publish=None, state_lock=nullcontext()):
+    """
+    Один цикл работы бота.
+    Запускается опрос токенов, для которых подошло время по расписанию,
+    и обрабатываются результаты по мере готовности: каждый токен
+    опрашивается один раз, а готовое сообщение о статусе рассылается
+    во все подписанные на него чаты. Сообщения описывают все новые
+    изменения статусов токена; о работе, которую не удалось описать,
+    чаты уведомляются ошибкой. Токены в паузе после сбоя или
+    в карантине переносятся в расписании. Сообщение вместе с новой
+    отметкой токена записывается в журнал до отправки, поэтому при
+    падении процесса оно будет отправлено после перезапуска.
+    publish(chat_ids, messages, state) заменяет немедленную рассылку,
+    например записью для доставщика (runner.DeliveryWorker); через нее
+    же уходят уведомления об ошибках (state=None). state_lock
+    удерживается только на сдвиг отметки и запись в журнал, чтобы
+    сохранение состояния (checkpoint) не ждало ни API, ни рассылки.
+    """
+    def publish_notice(chat_ids, message):
+        publish(chat_ids, [message], None)
+        return True
+
+    notify = None if publish is None else publish_notice
+
+    for token in poller.submit(scheduler.due()):
+        if not poller.is_polling(token):
+            scheduler.schedule(token, poller.ready_at(token))
+    for token, snapshot in poller.collect(POLL_COLLECT_TIME):
+        scheduler.record(token, snapshot.homeworks,
+                         failed=snapshot.error is not None)
+        ready_at = poller.ready_at(token)
+        if ready_at > scheduler.next_polls[token]:
+            scheduler.schedule(token, ready_at)
+        chat_ids = fan_out.chats(token)
+        if snapshot.error is not None:
+            handle_error(delivery, token, chat_ids, snapshot.error, notify)
+            continue
+        if not snapshot.messages:
+            # Без новых работ отметка сдвигается только по current_date,
+            # и ее не нужно сохранять: после перезапуска окно лишь
+            # начнется раньше.
+            with state_lock:
+                watermarks.commit(token, snapshot.homeworks,
+                                  snapshot.current_date)
+            if snapshot.render_error is None:
+                logger.debug('Новые статусы домашних работ отсутствуют.')
+            handle_error(delivery, token, chat_ids,
+                         snapshot.render_error or NO_UPDATES, notify)
+            continue
+        reset_errors(token)
+        publish_snapshot(delivery, outbox, watermarks, chat_ids, snapshot,
+                         publish, state_lock)
+        if snapshot.render_error is not None:
+            handle_error(delivery, token, chat_ids, snapshot.render_error,
+                         notify)
+
+
+def schedule_status(scheduler):
+    """
+    Секунды до следующего опроса по подпискам.
+    Токены в ответе маскируются, видны только последние символы.
+    """
+    now = time.monotonic()
+    return {f'...{str(token)[-4:]}': round(when - now, 1)
+            for token, when in scheduler.next_poll_times().items()}
+
+
+def create_commands(subscriptions, fetch=get_homeworks, rate_limiter=None):
+    """
+    Получатель команд пользователей (без запуска).
+    Основной цикл передает результаты опроса в его кэш работ
+    (listener.handler.cache), чтобы команды не обращались к API
+    лишний раз. Команды приходят из Telegram, поэтому ответы уходят
+    через собственного бота получателя независимо от NOTIFIER;
+    fetch(token) - запрос полного списка работ для устаревшего кэша,
+    rate_limiter - лимит частоты, общий с рассылкой через Telegram.
+    """
+    cache = StatusCache(fetch, COMMAND_CACHE_TTL,
+                        clock=time.monotonic)
+    tokens = {}
+    for subscription in subscriptions:
+        tokens.setdefault(subscription.chat_id, []).append(
+            subscription.token
+        )
+    handler = CommandHandler(cache, tokens, format_homework,
+                             COMMAND_HISTORY_LIMIT)
+    # Соединения нужны потоку getUpdates и каждому потоку ответов.
+    bot = create_bot(COMMAND_WORKERS + 1)
+    replies = DeliveryExecutor(
+        TelegramNotifier(bot, REQUEST_TIMEOUT, rate_limiter),
+        retries=DELIVERY_RETRIES
+    )
+
+    def reply(chat_id, text):
+        result = replies.deliver(text, [chat_id])
+        if not result:
+            raise result.failed[chat_id]
+
+    return UpdateListener(bot, handler, reply, REQUEST_TIMEOUT,
+                          COMMAND_WORKERS)
+
+
+def create_budget(tokens, clock=time.monotonic):
+    """
+    Общий лимит запросов к API или None без ограничения.
+    Без API_REQUESTS_PER_MINUTE каждый токен в среднем опрашивается
+    раз в RETRY_TIME секунд, с запасом на один опрос всех токенов.
+    """
+    if API_REQUESTS_PER_MINUTE is None:
+        return RateLimiter(tokens / RETRY_TIME, max(1, tokens), clock=clock)
+    if API_REQUESTS_PER_MINUTE <= 0:
+        return None
+    return RateLimiter(API_REQUESTS_PER_MINUTE / 60, API_REQUESTS_PER_MINUTE,
+                       clock=clock)
+
+
+def create_command_budget(clock=time.monotonic):
+    """
+    Лимит запросов команд к API или None без ограничения.
+    Лимит отдельный: опрос по расписанию расходует общий лимит целиком,
+    и команды с ним никогда не обновляли бы кэш.
+    """
+    if COMMAND_REQUESTS_PER_MINUTE <= 0:
+        return None
+    return RateLimiter(COMMAND_REQUESTS_PER_MINUTE / 60,
+                       COMMAND_REQUESTS_PER_MINUTE, clock=clock)
+
+
+def create_bot(pool_size):
+    """
+    Бот Telegram с пулом на pool_size соединений.
+    По умолчанию бот держит одно соединение, и при параллельной
+    рассылке каждое сообщение открывало бы новое TLS-соединение.
+    """
+    return telegram.Bot(token=TELEGRAM_TOKEN,
+                        request=Request(con_pool_size=pool_size))
+
+
+def create_rate_limiter():
+    """Общий лимит частоты сообщений Telegram-бота или None."""
+    if TELEGRAM_RATE_LIMIT > 0:
+        return RateLimiter(TELEGRAM_RATE_LIMIT)
+    return None
+
+
+def create_notifier(rate_limiter=None):
+    """
+    Канал уведомлений, выбранный переменной окружения NOTIFIER.
+    rate_limiter - лимит частоты для рассылки через Telegram.
+    Неизвестный канал или webhook без WEBHOOK_URL - ValueError при
+    запуске, а не повторы каждого сообщения из журнала.
+    """
+    error = None
+    if NOTIFIER not in NOTIFIERS:
+        error = (f'Неизвестный канал уведомлений NOTIFIER={NOTIFIER}, '
+                 f'допустимые значения: {", ".join(NOTIFIERS)}')
+    elif NOTIFIER == 'webhook' and not WEBHOOK_URL:
+        error = 'Для NOTIFIER=webhook нужна переменная окружения WEBHOOK_URL'
+    if error is not None:
+        logger.critical(error)
+        raise ValueError(error)
+    if NOTIFIER == 'webhook':
+        return WebhookNotifier(WEBHOOK_URL, REQUEST_TIMEOUT,
+                               pool_size=DELIVERY_WORKERS)
+    if NOTIFIER == 'file':
+        return FileNotifier(NOTIFY_FILE)
+    if NOTIFIER == 'stdout':
+        return StreamNotifier(sys.stdout)
+    return TelegramNotifier(create_bot(DELIVERY_WORKERS + 1),
+                            REQUEST_TIMEOUT, rate_limiter)
+
+
+def build(autocheckpoint=True):
+    """
+    Создание частей бота, общих для main() и run().
+    Отметки подписок восстанавливаются из журнала сообщений.
+    """
+    rate_limiter = create_rate_limiter()
+    delivery = DeliveryExecutor(create_notifier(rate_limiter),
+                                DELIVERY_WORKERS, DELIVERY_RETRIES)
+    subscriptions = load_subscriptions(SUBSCRIPTIONS, PRACTICUM_TOKEN,
+                                       TELEGRAM_CHAT_ID)
+    fan_out = TokenFanOut(subscriptions, get_token_api_answer,
+                          PROFILER.wrap('check_response', check_response),
+                          PROFILER.wrap('parse_status', parse_status))
+    watermarks = WatermarkManager(fan_out.groups, int(time.time()),
+                                  WATERMARK_OVERLAP)
+    outbox = Outbox(OUTBOX_PATH, OUTBOX_MAX_ATTEMPTS,
+                    clock=lambda: time.time(), autocheckpoint=autocheckpoint,
+                    backoff=OUTBOX_RETRY_BACKOFF,
+                    max_backoff=OUTBOX_MAX_BACKOFF, max_age=OUTBOX_MAX_AGE)
+    for token in fan_out.groups:
+        state = outbox.load_state(token)
+        if state is not None:
+            watermarks.restore(token, state)
+    scheduler = PollScheduler(fan_out.groups, POLL_INTERVALS,
+                              budget=create_budget(len(fan_out.groups),
+                                                   time.monotonic),
+                              clock=time.monotonic)
+    commands = None
+
+    def poll(token):
+        snapshot = fan_out.poll_token(token, watermarks)
+        if commands is None:
+            return snapshot
+        return commands.handler.cache.observe(snapshot)
+
+    # Опрос токена замеряется целиком: в потоке опроса это внешний
+    # этап, под которым попадают в профиль запрос и разбор ответа.
+    poller = IsolatedPoller(
+        PROFILER.wrap('poll', poll), POLL_WORKERS, POLL_TIMEOUT,
+        ERROR_BUDGET, ERROR_BACKOFF,
+        quarantine=QUARANTINE_TIME, inline=len(fan_out.groups) == 1,
+        clock=time.monotonic
+    )
+    if COMMANDS:
+        # Запросы команд к API делят с опросом карантин, но не лимит.
+        command_budget = create_command_budget(time.monotonic)
+        commands = create_commands(
+            subscriptions,
+            lambda token: get_homeworks(token, command_budget, poller),
+            rate_limiter
+        )
+    return SimpleNamespace(delivery=delivery, fan_out=fan_out,
+                           watermarks=watermarks, outbox=outbox,
+                           scheduler=scheduler, poller=poller,
+                           commands=commands)
+
+
+def poll_delay(app):
+    """
+    Пауза до следующего цикла.
+    Пока есть незавершенные опросы, цикл просыпается чаще, чтобы
+    обработать их результаты сразу после получения.
+    """
+    return app.scheduler.delay(
+        POLL_COLLECT_TIME if app.poller.in_flight() else RETRY_TIME
+    )
+
+
+def create_health(routes):
+    """
+    Сервер проверок (без запуска) или None.
+    Сервер необязателен для работы бота: если HEALTH_PORT не задан или
+    порт занят, бот работает без него.
+    """
+    if not HEALTH_PORT:
+        return None
+    try:
+        return create_health_server(WATCHDOG, HEALTH_HOST, int(HEALTH_PORT),
+                                    routes)
+    except OSError as error:
+        logger.error(f'Не удалось запустить сервер проверок на '
+                     f'{HEALTH_HOST}:{HEALTH_PORT}: {error}')
+        return None
+
+
 def main():
     """Основная логика работы бота."""
-    bot = telegram.Bot(token=TELEGRAM_TOKEN)
-    current_timestamp = int(time.time())
+    app = build()
+    if app.commands is not None:
+        app.commands.start()
+    WATCHDOG.start()
+    server = create_health(
+        {'/schedule': lambda: schedule_status(app.scheduler)}
+    )
+    if server is not None:
+        threading.Thread(target=server.serve_forever, name='health',
+                         daemon=True).start()
+    if PROFILE:
+        PROFILER.install_signal()
     while True:
         if not check_tokens():
             break
-        try:
-            response = get_api_answer(current_timestamp)
-            homework = check_response(response)
-            if not homework:
-                logger.debug('Новые статусы домашних работ отсутствуют.')
-                raise UpdateError('На данный момент нет обновлений.')
-            else:
-                message = parse_status(homework[0])
-            send_message(bot, message)
-            current_timestamp = response.get('current_date')
-            time.sleep(RETRY_TIME)
-
-        except (NotFoundError, ResponseValueError,
-                NotListResultError, ResponseTypeError,
-                KeyError, CustomKeyError) as error:
-            logger.error('В результате работы бота '
-                         'возникла ошибка: '
-                         f'{type(error).__name__}: {error}'
-                         )
-            if not EXCEPTIONS[type(error).__name__]:
-                message = ('В результате работы бота возникла '
-                           f'ошибка: {error}')
-                EXCEPTIONS[type(error).__name__] = send_message(bot, message)
-            time.sleep(RETRY_TIME)
-
-        except UpdateError as error:
-            logger.debug(f'{type(error).__name__}: {error}')
-            if not EXCEPTIONS[type(error).__name__]:
-                message = (f'{error}')
-                EXCEPTIONS[type(error).__name__] = send_message(bot, message)
-            time.sleep(RETRY_TIME)
-
-        except Exception as error:
-            logger.error('В результате работы бота возникла '
-                         f'ошибка: {type(error).__name__}: {error}')
-            time.sleep(RETRY_TIME)
+        with PROFILER.cycle():
+            # Сначала досылаются записи, не доставленные в прошлых циклах.
+            replay_outbox(app.delivery, app.outbox)
+            process_cycle(app.delivery, app.fan_out, app.watermarks,
+                          app.scheduler, app.poller, app.outbox)
+            app.outbox.prune(time.time() - OUTBOX_RETENTION)
+        WATCHDOG.beat('cycle')
+        time.sleep(poll_delay(app))
+
+
+def poll_loop(app, worker, state_lock, stopping):
+    """
+    Цикл опроса для run(): сообщения уходят доставщику через очередь.
+    Под state_lock сообщения только записываются в журнал, а в очередь
+    ставятся после него: ожидание места в очереди не задерживает
+    сохранение состояния.
+    """
+    while not stopping.is_set():
+        if not check_tokens():
+            return
+        outgoing = []
+
+        def publish(chat_ids, messages, state):
+            outgoing.append(worker.journal(chat_ids, messages, state))
+
+        with PROFILER.cycle():
+            process_cycle(app.delivery, app.fan_out, app.watermarks,
+                          app.scheduler, app.poller, app.outbox,
+                          publish, state_lock)
+            for entries in outgoing:
+                worker.enqueue(entries)
+        WATCHDOG.beat('cycle')
+        stopping.wait(poll_delay(app))
+
+
+def checkpoint(app, state_lock):
+    """
+    Сохранение отметок всех подписок и обслуживание журнала.
+    Отметки читаются под state_lock: цикл опроса сдвигает отметку
+    и записывает сообщение в журнал, не отпуская его.
+    """
+    with state_lock:
+        app.outbox.save_state({token: app.watermarks.dump(token)
+                               for token in app.fan_out.groups})
+    app.outbox.prune(time.time() - OUTBOX_RETENTION)
+    app.outbox.checkpoint()
+
+
+def checkpoint_loop(app, state_lock, stopping):
+    """Периодическое сохранение состояния и последнее - при остановке."""
+    while not stopping.wait(CHECKPOINT_INTERVAL):
+        checkpoint(app, state_lock)
+    checkpoint(app, state_lock)
+
+
+def run():
+    """
+    Работа бота компонентами в одном процессе (RUNNER=1).
+    Опрос, доставка, сервер проверок с метриками /metrics, ответы
+    на команды и сохранение состояния работают в своих потоках с общим
+    жизненным циклом. Опрос передает сообщения доставщику через
+    ограниченную очередь и ждет, если доставка не успевает.
+    Возвращает True, если работа завершилась без сбоев.
+    """
+    if not check_tokens():
+        return False
+    app = build(autocheckpoint=False)
+    worker = DeliveryWorker(
+        app.outbox,
+        lambda entries: deliver_entries(app.delivery, app.outbox, entries),
+        DELIVERY_QUEUE_SIZE, replay_interval=RETRY_TIME
+    )
+    state_lock = threading.Lock()
+    components = [
+        Component('delivery', worker.run, threads=('delivery_',)),
+        Component('poller',
+                  lambda stopping: poll_loop(app, worker, state_lock,
+                                             stopping),
+                  threads=('poll_',)),
+        Component('checkpoint',
+                  lambda stopping: checkpoint_loop(app, state_lock,
+                                                   stopping)),
+    ]
+    if app.commands is not None:
+        components.append(Component(
+            'commands', lambda stopping: app.commands.run(),
+            stop=app.commands.stop, threads=('command_',)
+        ))
+    runtime = Runtime(components, queues=[worker.queue])
+    server = create_health({
+        '/schedule': lambda: schedule_status(app.scheduler),
+        '/metrics': runtime.status,
+    })
+    if server is not None:
+        runtime.components.append(Component(
+            'health', lambda stopping: server.serve_forever(),
+            stop=server.shutdown
+        ))
+    WATCHDOG.start()
+    if PROFILE:
+        PROFILER.install_signal()
+    try:
+        return runtime.run()
+    finally:
+        app.poller.shutdown()
+        app.delivery.shutdown()
+        app.outbox.close()
 
 
 if __name__ == '__main__':
+    if RUNNER:
+        sys.exit(not run())
     main()
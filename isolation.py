@@ -0,0 +1,196 @@
+"""
+Изоляция подписок друг от друга.
+Каждый токен опрашивается в своем потоке и имеет собственные таймаут,
+бюджет ошибок, паузу после сбоев и карантин после повторных отказов
+API. Готовые результаты обрабатываются по мере поступления, поэтому
+медленный или сломанный токен не задерживает остальные.
+"""
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from exceptions import UnauthorizedError
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriptionState:
+    """Состояние изоляции одного токена."""
+
+    __slots__ = ('failures', 'refusals', 'retry_at', 'quarantined_until',
+                 'future', 'started', 'timed_out')
+
+    def __init__(self):
+        self.failures = 0
+        self.refusals = 0
+        self.retry_at = 0
+        self.quarantined_until = 0
+        self.future = None
+        self.started = None
+        self.timed_out = False
+
+
+class CompletedPoll:
+    """
+    Результат опроса, выполненного в текущем потоке.
+    Повторяет нужную часть интерфейса Future без блокировок.
+    """
+
+    __slots__ = ('snapshot',)
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def done(self):
+        """Опрос всегда завершен."""
+        return True
+
+    def result(self):
+        """Снимок опроса."""
+        return self.snapshot
+
+
+class IsolatedPoller:
+    """
+    Опрос токенов с изоляцией сбоев.
+    poll(token) должна возвращать снимок с полем error (см.
+    subscriptions.TokenSnapshot). После сбоя токен ждет паузу, растущую
+    экспоненциально; после error_budget отказов API в доступе подряд
+    (UnauthorizedError, 401/403) он уходит в карантин. Сетевые сбои и
+    ответы 5xx не зависят от токена, поэтому для них хватает паузы.
+    При inline=True опрос идет в текущем потоке: так работает бот
+    с единственной подпиской, которую не от кого изолировать.
+    """
+
+    def __init__(self, poll, max_workers=8, timeout=30, error_budget=5,
+                 backoff=30, max_backoff=1800, quarantine=3600,
+                 inline=False, clock=time.monotonic):
+        self.poll = poll
+        self.timeout = timeout
+        self.error_budget = error_budget
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.quarantine = quarantine
+        self.clock = clock
+        self.states = {}
+        self.pool = None if inline else ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='poll'
+        )
+
+    def state(self, token):
+        """Состояние токена; создается при первом обращении."""
+        state = self.states.get(token)
+        if state is None:
+            state = self.states[token] = SubscriptionState()
+        return state
+
+    def ready_at(self, token):
+        """Время, раньше которого токен опрашивать нельзя."""
+        state = self.state(token)
+        return max(state.retry_at, state.quarantined_until)
+
+    def is_ready(self, token):
+        """
+        Токен можно опрашивать: он не в паузе после сбоя и не в карантине.
+        Не создает состояние токена, поэтому безопасен для вызова
+        из других потоков.
+        """
+        state = self.states.get(token)
+        return (state is None or max(state.retry_at, state.quarantined_until)
+                <= self.clock())
+
+    def is_quarantined(self, token):
+        """Токен находится в карантине."""
+        return self.state(token).quarantined_until > self.clock()
+
+    def is_polling(self, token):
+        """Опрос токена запущен и еще не выдан."""
+        return self.state(token).future is not None
+
+    def in_flight(self):
+        """Токены, опрос которых еще не завершен."""
+        return [token for token, state in self.states.items()
+                if state.future is not None]
+
+    def record(self, token, error):
+        """Учет результата опроса: сброс или наращивание паузы."""
+        state = self.state(token)
+        now = self.clock()
+        if error is None:
+            state.failures = state.refusals = 0
+            state.retry_at = 0
+            return
+        state.failures += 1
+        state.retry_at = now + min(
+            self.backoff * 2 ** (state.failures - 1), self.max_backoff
+        )
+        if isinstance(error, UnauthorizedError):
+            state.refusals += 1
+            if state.refusals >= self.error_budget:
+                state.quarantined_until = now + self.quarantine
+                state.refusals = 0
+                logger.warning(f'Токен ...{str(token)[-4:]} помещен '
+                               f'в карантин на {self.quarantine} с.')
+
+    def submit(self, tokens):
+        """
+        Запуск опроса токенов.
+        Токены в паузе, в карантине и с незавершенным опросом
+        пропускаются и возвращаются списком.
+        """
+        now = self.clock()
+        skipped = []
+        for token in tokens:
+            state = self.state(token)
+            if state.future is not None or self.ready_at(token) > now:
+                skipped.append(token)
+                continue
+            state.started = now
+            state.timed_out = False
+            if self.pool is None:
+                state.future = CompletedPoll(self.poll(token))
+            else:
+                state.future = self.pool.submit(self.poll, token)
+        return skipped
+
+    def collect(self, timeout):
+        """
+        Выдача готовых результатов в порядке завершения.
+        Ожидание длится не дольше timeout секунд; незавершенные опросы
+        остаются в работе и будут выданы в следующих вызовах, а токены,
+        превысившие свой таймаут, получают сбой и паузу.
+        """
+        futures = {self.states[token].future: token
+                   for token in self.in_flight()}
+        deadline = time.monotonic() + timeout
+        while futures:
+            done = [future for future in futures if future.done()]
+            if not done:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, _ = wait(futures, timeout=remaining,
+                               return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+            for future in done:
+                token = futures.pop(future)
+                state = self.states[token]
+                state.future = None
+                snapshot = future.result()
+                if not state.timed_out:
+                    self.record(token, snapshot.error)
+                elif snapshot.error is None:
+                    self.record(token, None)
+                yield token, snapshot
+        now = self.clock()
+        for token in futures.values():
+            state = self.states[token]
+            if not state.timed_out and now - state.started > self.timeout:
+                state.timed_out = True
+                self.record(token, TimeoutError(token))
+
+    def shutdown(self):
+        """Остановка пула без ожидания зависших опросов."""
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
@@ -0,0 +1,129 @@
+"""
+Каналы уведомлений пользователей.
+Каждый канал умеет отправить сообщение в один чат и, при возможности,
+пачку сообщений за один вызов. Пул потоков, пакетирование, повторы и
+ограничение частоты реализованы один раз в delivery.DeliveryExecutor.
+"""
+import json
+import sys
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class Notifier:
+    """
+    Базовый канал уведомлений.
+    batch_size - сколько сообщений канал принимает за один вызов
+    send_batch, rate_limiter - общий лимит частоты канала или None.
+    """
+
+    batch_size = 1
+    rate_limiter = None
+
+    def send(self, chat_id, text):
+        """Отправка сообщения в один чат; при неудаче - исключение."""
+        raise NotImplementedError
+
+    def send_batch(self, items):
+        """Отправка пачки пар (chat_id, text)."""
+        for chat_id, text in items:
+            self.send(chat_id, text)
+
+    def close(self):
+        """Освобождение ресурсов канала."""
+
+
+class TelegramNotifier(Notifier):
+    """Отправка сообщений через Telegram-бота."""
+
+    def __init__(self, bot, timeout=None, rate_limiter=None):
+        self.bot = bot
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+
+    def send(self, chat_id, text):
+        """Отправка сообщения в чат Telegram."""
+        self.bot.send_message(chat_id=chat_id, text=text,
+                              timeout=self.timeout)
+
+
+class WebhookNotifier(Notifier):
+    """
+    Отправка сообщений POST-запросом с JSON на внешний адрес.
+    Соединения переиспользуются через общую сессию requests,
+    пачка сообщений уходит одним запросом. Тело запроса всегда одного
+    вида: {'messages': [{'chat_id': ..., 'text': ...}, ...]}.
+    """
+
+    def __init__(self, url, timeout=None, batch_size=50, pool_size=8,
+                 session=None):
+        self.url = url
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def post(self, payload):
+        """POST-запрос с проверкой кода ответа."""
+        response = self.session.post(self.url, json=payload,
+                                     timeout=self.timeout)
+        response.raise_for_status()
+
+    def send(self, chat_id, text):
+        """Отправка одного сообщения."""
+        self.send_batch(((chat_id, text),))
+
+    def send_batch(self, items):
+        """Отправка пачки сообщений одним запросом."""
+        self.post({'messages': [{'chat_id': chat_id, 'text': text}
+                                for chat_id, text in items]})
+
+    def close(self):
+        """Закрытие сессии."""
+        self.session.close()
+
+
+class StreamNotifier(Notifier):
+    """
+    Запись сообщений в поток в формате JSON Lines.
+    Подходит для локальной отладки и нагрузочных замеров.
+    """
+
+    batch_size = 100
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def format(chat_id, text):
+        """Строка JSON Lines для одного сообщения."""
+        return json.dumps({'chat_id': chat_id, 'text': text},
+                          ensure_ascii=False) + '\n'
+
+    def send(self, chat_id, text):
+        """Запись одного сообщения."""
+        self.send_batch(((chat_id, text),))
+
+    def send_batch(self, items):
+        """Запись пачки сообщений с одним сбросом буфера."""
+        lines = ''.join(self.format(chat_id, text)
+                        for chat_id, text in items)
+        with self.lock:
+            self.stream.write(lines)
+            self.stream.flush()
+
+
+class FileNotifier(StreamNotifier):
+    """Дозапись сообщений в локальный файл в формате JSON Lines."""
+
+    def __init__(self, path):
+        super().__init__(open(path, 'a', encoding='utf-8'))
+
+    def close(self):
+        """Закрытие файла."""
+        self.stream.close()
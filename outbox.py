@@ -0,0 +1,196 @@
+"""
+Журнал исходящих сообщений (outbox).
+Готовые сообщения записываются в SQLite в режиме WAL до отправки и
+помечаются доставленными после нее. В той же транзакции сохраняется
+состояние подписки, поэтому после падения процесса сообщение не
+теряется и не формируется повторно: при запуске недоставленные записи
+отправляются заново. После неудачной отправки запись ждет повтора
+с экспоненциально растущей паузой.
+"""
+import functools
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+PENDING, DELIVERED, DROPPED = 0, 1, 2
+
+INSERT_ENTRY = 'INSERT INTO outbox (chat_id, text, created) VALUES (?, ?, ?)'
+SAVE_STATE = 'INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)'
+# Число идентификаторов в одном запросе: до SQLite 3.32 параметров
+# в запросе может быть не больше 999.
+MAX_IDS = 500
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    chat_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    status INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS outbox_status ON outbox (status, id);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+
+@functools.lru_cache(maxsize=None)
+def state_key(token):
+    """Ключ состояния подписки; сам токен в журнал не попадает."""
+    return hashlib.sha256(str(token).encode()).hexdigest()[:16]
+
+
+class Outbox:
+    """
+    Журнал сообщений на SQLite.
+    Все записи одной подписки за цикл и ее состояние фиксируются одной
+    транзакцией (group commit); в режиме WAL с synchronous=NORMAL
+    такая транзакция не требует fsync на каждое сообщение. Доставленные
+    записи отмечаются одним запросом без явной транзакции. При
+    autocheckpoint=False перенос WAL в основной файл выполняется только
+    вызовом checkpoint(), например из фонового компонента.
+    Недоставленная запись повторяется через backoff * 2 ** (попытки - 1)
+    секунд, но не реже раза в max_backoff, и отбрасывается после
+    max_attempts попыток или если она старше max_age секунд.
+    """
+
+    def __init__(self, path, max_attempts=20, clock=time.time,
+                 autocheckpoint=True, backoff=60, max_backoff=3600,
+                 max_age=24 * 3600):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_age = max_age
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False,
+                                          isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        if not autocheckpoint:
+            # Перенос WAL в основной файл выполняет checkpoint().
+            self.connection.execute('PRAGMA wal_autocheckpoint=0')
+        self.connection.executescript(SCHEMA)
+        columns = {row[1] for row in self.connection.execute(
+            'PRAGMA table_info(outbox)'
+        )}
+        if 'next_attempt' not in columns:
+            # Журнал, созданный до появления паузы между повторами.
+            self.connection.execute('ALTER TABLE outbox ADD COLUMN '
+                                    'next_attempt REAL NOT NULL DEFAULT 0')
+        # Один курсор на все запросы: журнал работает под блокировкой.
+        self.cursor = self.connection.cursor()
+
+    def transaction(self, statements):
+        """Выполнение списка (sql, параметры) одной транзакцией."""
+        with self.lock:
+            execute = self.cursor.execute
+            execute('BEGIN')
+            try:
+                ids = [execute(sql, params).lastrowid
+                       for sql, params in statements]
+            except BaseException:
+                execute('ROLLBACK')
+                raise
+            execute('COMMIT')
+            return ids
+
+    def append(self, chat_ids, texts, state=None):
+        """
+        Запись сообщений для чатов и состояния подписок.
+        state - словарь {токен: данные для JSON}. Возвращает записи
+        (id, chat_id, text): по каждому сообщению для всех чатов.
+        """
+        now = self.clock()
+        entries = [(chat_id, text) for text in texts for chat_id in chat_ids]
+        statements = [(INSERT_ENTRY, (str(chat_id), text, now))
+                      for chat_id, text in entries]
+        statements.extend(self.state_statements(state))
+        ids = self.transaction(statements)
+        return [(entry_id, chat_id, text)
+                for entry_id, (chat_id, text) in zip(ids, entries)]
+
+    def save_state(self, state):
+        """Сохранение состояния подписок без сообщений."""
+        self.transaction(self.state_statements(state))
+
+    @staticmethod
+    def state_statements(state):
+        """Запросы сохранения состояния подписок."""
+        return [(SAVE_STATE, (state_key(token), json.dumps(value)))
+                for token, value in (state or {}).items()]
+
+    def load_state(self, token):
+        """Сохраненное состояние подписки или None."""
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT value FROM state WHERE key = ?', (state_key(token),)
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def complete(self, delivered, failed=()):
+        """
+        Учет результатов отправки одной транзакцией.
+        Недоставленным записям назначается время следующей попытки;
+        записи, исчерпавшие попытки или срок, больше не повторяются.
+        Без сбоев хватает одного запроса, который атомарен и без
+        явной транзакции.
+        """
+        now = self.clock()
+        delivered = list(delivered)
+        statements = [
+            ('UPDATE outbox SET status = ?, attempts = attempts + 1 '
+             f'WHERE id IN ({", ".join("?" * len(chunk))})',
+             (DELIVERED, *chunk))
+            for chunk in (delivered[start:start + MAX_IDS]
+                          for start in range(0, len(delivered), MAX_IDS))
+        ]
+        # В выражениях UPDATE attempts - значение до увеличения.
+        statements.extend(
+            ('UPDATE outbox SET attempts = attempts + 1, '
+             'next_attempt = ? + min(? * (1 << min(attempts, 30)), ?), '
+             'status = CASE WHEN attempts + 1 >= ? OR created <= ? '
+             'THEN ? ELSE status END WHERE id = ?',
+             (now, self.backoff, self.max_backoff, self.max_attempts,
+              now - self.max_age, DROPPED, entry_id))
+            for entry_id in failed
+        )
+        if len(statements) == 1:
+            with self.lock:
+                self.cursor.execute(*statements[0])
+        elif statements:
+            self.transaction(statements)
+
+    def pending(self):
+        """
+        Недоставленные записи, время повтора которых наступило:
+        список (id, chat_id, text).
+        """
+        with self.lock:
+            return self.connection.execute(
+                'SELECT id, chat_id, text FROM outbox WHERE status = ? '
+                'AND next_attempt <= ? ORDER BY id', (PENDING, self.clock())
+            ).fetchall()
+
+    def prune(self, before):
+        """Удаление завершенных записей старше before."""
+        self.transaction([(
+            'DELETE FROM outbox WHERE status != ? AND created < ?',
+            (PENDING, before)
+        )])
+
+    def checkpoint(self):
+        """Перенос записей WAL в основной файл без блокировки читателей."""
+        with self.lock:
+            self.connection.execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+    def close(self):
+        """Закрытие журнала."""
+        with self.lock:
+            self.connection.close()
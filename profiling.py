@@ -0,0 +1,234 @@
+"""
+Профилирование цикла опроса.
+Каждый этап итерации main() замеряется через perf_counter_ns, а часть
+циклов дополнительно проходит под cProfile вместе с этапами, которые
+в это время выполняются в потоках опроса. По сигналу SIGUSR1 данные
+выгружаются в файлы pstats и collapsed stack (для flamegraph.pl или
+speedscope) без перезапуска бота.
+"""
+import cProfile
+import functools
+import logging
+import os
+import pstats
+import signal
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger(__name__)
+
+# Ограничение глубины стеков в collapsed-файле.
+MAX_STACK_DEPTH = 64
+
+
+class StageStats:
+    """Накопленные замеры одного этапа, в наносекундах."""
+
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, elapsed):
+        """Учет очередного замера."""
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+    def __str__(self):
+        """Сводка в миллисекундах."""
+        mean = self.total / self.count / 1e6 if self.count else 0
+        return (f'count={self.count} total={self.total / 1e6:.3f}ms '
+                f'mean={mean:.3f}ms max={self.max / 1e6:.3f}ms')
+
+
+class CycleProfiler:
+    """
+    Профилировщик итераций основного цикла.
+    В выключенном состоянии span() и wrap() ничего не замеряют,
+    поэтому накладные расходы сводятся к одному вызову. Этапы могут
+    замеряться из разных потоков: замеры и профили накапливаются под
+    блокировкой. Блокировка реентерабельная, потому что dump() по
+    сигналу выполняется в главном потоке поверх прерванного кода.
+    Сбой профилирования только логируется и не прерывает этап.
+    """
+
+    def __init__(self, enabled=False, sample_every=10, output_dir='.'):
+        self.enabled = enabled
+        self.sample_every = max(1, sample_every)
+        self.output_dir = output_dir
+        self.stages = {}
+        self.stats = None
+        self.cycles = 0
+        self.sampling = False
+        self.lock = threading.RLock()
+        self.local = threading.local()
+
+    def span(self, stage):
+        """Контекстный менеджер замера этапа."""
+        if not self.enabled:
+            return nullcontext()
+        return self._span(stage)
+
+    @contextmanager
+    def _span(self, stage):
+        # Во время профилируемого цикла внешний этап другого потока
+        # выполняется под собственным cProfile этого потока.
+        profile = self.start_profile() if self.sampling else None
+        started = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter_ns() - started
+            if profile is not None:
+                self.stop_profile(profile)
+            with self.lock:
+                stats = self.stages.get(stage)
+                if stats is None:
+                    stats = self.stages[stage] = StageStats()
+                stats.add(elapsed)
+
+    def start_profile(self):
+        """
+        Запуск cProfile в текущем потоке.
+        До Python 3.12 cProfile видит только поток, в котором включен,
+        поэтому у каждого потока свой профиль. С 3.12 профиль работает
+        через sys.monitoring и видит все потоки, а второй одновременно
+        включить нельзя: тогда, как и для уже профилируемого потока
+        или при другом сбое, возвращается None.
+        """
+        if getattr(self.local, 'profile', None) is not None:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Активен профиль цикла (3.12+) или другой профилировщик.
+            return None
+        except Exception as error:
+            logger.error(f'Не удалось включить профилирование: {error}')
+            return None
+        self.local.profile = profile
+        return profile
+
+    def stop_profile(self, profile):
+        """Остановка профиля потока и добавление его к общим данным."""
+        self.local.profile = None
+        try:
+            profile.disable()
+            with self.lock:
+                if self.stats is None:
+                    self.stats = pstats.Stats(profile)
+                else:
+                    self.stats.add(profile)
+        except Exception as error:
+            logger.error(f'Не удалось сохранить профиль: {error}')
+
+    def wrap(self, stage, func):
+        """Обертка функции замером этапа."""
+        if not self.enabled:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self._span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+    @contextmanager
+    def cycle(self):
+        """
+        Замер итерации цикла.
+        Каждая sample_every-я итерация выполняется под cProfile вместе
+        с этапами, которые другие потоки начинают во время нее;
+        результаты копятся в общем pstats.Stats.
+        """
+        if not self.enabled:
+            yield
+            return
+        self.cycles += 1
+        profile = None
+        if self.cycles % self.sample_every == 0:
+            profile = self.start_profile()
+            self.sampling = True
+        try:
+            with self._span('cycle'):
+                yield
+        finally:
+            if profile is not None:
+                self.sampling = False
+                self.stop_profile(profile)
+
+    def summary(self):
+        """Текстовая сводка по этапам."""
+        with self.lock:
+            return '\n'.join(f'{stage}: {stats}'
+                             for stage, stats in self.stages.items())
+
+    def dump(self):
+        """Выгрузка замеров этапов, pstats и collapsed stack в файлы."""
+        prefix = os.path.join(self.output_dir, f'profile-{os.getpid()}')
+        with open(f'{prefix}.spans.txt', 'w') as file:
+            file.write(self.summary() + '\n')
+        with self.lock:
+            if self.stats is not None:
+                self.stats.dump_stats(f'{prefix}.pstats')
+                with open(f'{prefix}.collapsed', 'w') as file:
+                    file.writelines(f'{stack} {weight}\n' for stack, weight
+                                    in collapse_stats(self.stats).items())
+        logger.warning(f'Профиль выгружен в {prefix}.*\n{self.summary()}')
+        return prefix
+
+    def install_signal(self, signum=getattr(signal, 'SIGUSR1', None)):
+        """Выгрузка профиля по сигналу (по умолчанию SIGUSR1)."""
+        if signum is None:
+            return False
+        signal.signal(signum, lambda *args: self.dump())
+        return True
+
+
+def function_label(func):
+    """Имя функции из pstats в виде 'file:line:name'."""
+    filename, line, name = func
+    return f'{os.path.basename(filename)}:{line}:{name}'
+
+
+def collapse_stats(stats):
+    """
+    Восстановление collapsed-стеков из pstats.
+    pstats хранит только пары вызывающий-вызываемый, поэтому время
+    функции распределяется по путям пропорционально доле общего
+    времени, полученной от каждого вызывающего. Вес - микросекунды
+    собственного времени функции на этом пути.
+    """
+    callees = {}
+    for func, (_, _, _, cumtime, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            share = edge[3] / cumtime if cumtime else 0
+            callees.setdefault(caller, []).append((func, share))
+    roots = [func for func, (*_, callers) in stats.stats.items()
+             if not callers]
+    stacks = {}
+
+    def walk(func, path, share):
+        path = path + (func,)
+        _, _, tottime, cumtime, _ = stats.stats[func]
+        if cumtime * share < 1e-6:
+            return
+        weight = int(tottime * share * 1e6)
+        if weight:
+            stack = ';'.join(function_label(item) for item in path)
+            stacks[stack] = stacks.get(stack, 0) + weight
+        if len(path) >= MAX_STACK_DEPTH:
+            return
+        for callee, callee_share in callees.get(func, ()):
+            if callee not in path:
+                walk(callee, path, share * callee_share)
+
+    for root in roots:
+        walk(root, (), 1.0)
+    return stacks
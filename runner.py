@@ -0,0 +1,322 @@
+"""
+Работа бота компонентами в одном процессе.
+Опрос API, доставка сообщений, сервер проверок и сохранение состояния
+запускаются как компоненты с общим жизненным циклом: сбой или
+завершение любого из них, как и SIGTERM, останавливает весь процесс.
+Компоненты обмениваются данными через ограниченные очереди: когда
+доставка не успевает, опрос ждет свободного места. Процессорное время
+учитывается по потокам каждого компонента.
+"""
+import logging
+import queue
+import signal
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def thread_cpu_time(thread):
+    """Процессорное время потока в секундах или None, если недоступно."""
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+    except (AttributeError, OSError, TypeError):
+        return None
+
+
+class Component:
+    """
+    Компонент процесса.
+    target(stopping) работает в собственном потоке компонента, пока не
+    установлено событие stopping; ждать внутри нужно через
+    stopping.wait(), чтобы остановка не задерживалась. stop() вызывается
+    при остановке процесса для компонентов, которые блокируются вне
+    stopping (например, HTTP-сервер). threads - префиксы имен
+    вспомогательных потоков (пулов), время которых относится к компоненту.
+    """
+
+    def __init__(self, name, target, stop=None, threads=()):
+        self.name = name
+        self.target = target
+        self.stop = stop
+        self.threads = tuple(threads)
+        self.thread = None
+
+    def owns(self, thread):
+        """Поток принадлежит компоненту."""
+        return (thread.name == self.name
+                or thread.name.startswith(self.threads))
+
+
+class BoundedQueue:
+    """
+    Очередь ограниченного размера между компонентами.
+    Запоминает наибольшую длину и суммарное время, которое
+    производители провели в ожидании места (backpressure).
+    """
+
+    def __init__(self, name, maxsize, poll_interval=0.5):
+        self.name = name
+        self.queue = queue.Queue(maxsize)
+        self.poll_interval = poll_interval
+        self.high_water = 0
+        self.blocked = 0.0
+        self.puts = 0
+
+    def put(self, item, stopping):
+        """
+        Добавление элемента с ожиданием места.
+        Возвращает False, если процесс остановлен раньше, чем место
+        освободилось.
+        """
+        started = None
+        while True:
+            try:
+                self.queue.put(item, timeout=self.poll_interval)
+                break
+            except queue.Full:
+                if started is None:
+                    started = time.monotonic()
+                if stopping.is_set():
+                    self.blocked += time.monotonic() - started
+                    return False
+        if started is not None:
+            self.blocked += time.monotonic() - started
+        self.puts += 1
+        self.high_water = max(self.high_water, self.queue.qsize())
+        return True
+
+    def get_batch(self, limit, timeout):
+        """До limit элементов; ждет только первого, не дольше timeout."""
+        try:
+            items = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(items) < limit:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def stats(self):
+        """Состояние очереди для метрик."""
+        return {'size': self.queue.qsize(), 'maxsize': self.queue.maxsize,
+                'high_water': self.high_water, 'puts': self.puts,
+                'blocked': round(self.blocked, 3)}
+
+
+class DeliveryWorker:
+    """
+    Доставка сообщений из журнала отдельным компонентом.
+    publish() записывает сообщения в журнал (outbox.Outbox) и ставит
+    записи в очередь; send(entries) рассылает записи и отмечает
+    результат в журнале. В простое доставщик раз в replay_interval
+    секунд досылает недоставленные записи, пропуская стоящие в очереди.
+    """
+
+    def __init__(self, outbox, send, queue_size=100, batch_size=20,
+                 replay_interval=60, clock=time.monotonic):
+        self.outbox = outbox
+        self.send = send
+        self.queue = BoundedQueue('delivery', queue_size)
+        self.batch_size = batch_size
+        self.replay_interval = replay_interval
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.in_flight = set()
+        self.replayed = None
+        self.stopping = threading.Event()
+
+    def journal(self, chat_ids, messages, state=None):
+        """
+        Запись сообщений в журнал; до постановки в очередь (enqueue)
+        записи не досылаются повторно.
+        """
+        with self.lock:
+            entries = self.outbox.append(chat_ids, messages, state)
+            self.in_flight.update(entry[0] for entry in entries)
+        return entries
+
+    def enqueue(self, entries):
+        """Постановка записей журнала в очередь с ожиданием места."""
+        return self.queue.put(entries, self.stopping)
+
+    def publish(self, chat_ids, messages, state=None):
+        """Запись сообщений в журнал и постановка в очередь доставки."""
+        return self.enqueue(self.journal(chat_ids, messages, state))
+
+    def deliver(self, entries):
+        """Рассылка записей и снятие их с учета."""
+        try:
+            self.send(entries)
+        finally:
+            with self.lock:
+                self.in_flight.difference_update(
+                    entry_id for entry_id, _, _ in entries
+                )
+
+    def replay(self):
+        """Досылка недоставленных записей, которых нет в очереди."""
+        self.replayed = self.clock()
+        with self.lock:
+            entries = [entry for entry in self.outbox.pending()
+                       if entry[0] not in self.in_flight]
+            self.in_flight.update(entry[0] for entry in entries)
+        if entries:
+            logger.info(f'Повторная отправка сообщений из журнала: '
+                        f'{len(entries)}')
+            self.deliver(entries)
+
+    def step(self, timeout=1):
+        """Доставка одной пачки из очереди или досылка в простое."""
+        batch = self.queue.get_batch(self.batch_size, timeout)
+        if batch:
+            self.deliver([entry for entries in batch for entry in entries])
+        elif (self.replayed is None
+              or self.clock() - self.replayed >= self.replay_interval):
+            self.replay()
+
+    def run(self, stopping):
+        """Доставка до остановки процесса."""
+        self.stopping = stopping
+        while not stopping.is_set():
+            self.step()
+
+
+class Runtime:
+    """
+    Общий жизненный цикл компонентов.
+    Компоненты запускаются в порядке списка и останавливаются в обратном;
+    на остановку всех компонентов отводится join_timeout секунд (Heroku
+    ждет после SIGTERM 30 секунд).
+    """
+
+    def __init__(self, components, join_timeout=10, queues=()):
+        self.components = list(components)
+        self.join_timeout = join_timeout
+        self.queues = list(queues)
+        self.stopping = threading.Event()
+        self.failed = None
+        self.started = None
+        self.lock = threading.Lock()
+        self.cpu_seen = {}
+        self.cpu_retired = {}
+        self.finished = set()
+
+    def run_component(self, component):
+        """Работа компонента; его выход останавливает процесс."""
+        try:
+            component.target(self.stopping)
+        except Exception as error:
+            logger.critical(f'Сбой компонента {component.name}: {error}',
+                            exc_info=True)
+            self.failed = error
+        else:
+            if not self.stopping.is_set():
+                logger.info(f'Компонент {component.name} завершил работу.')
+        self.stopping.set()
+        with self.lock:
+            self.finished.add(threading.current_thread())
+            self.cpu_seen.pop(threading.current_thread(), None)
+            self.cpu_retired[component.name] = (
+                self.cpu_retired.get(component.name, 0.0) + time.thread_time()
+            )
+
+    def start(self):
+        """Запуск потоков всех компонентов."""
+        self.started = time.monotonic()
+        for component in self.components:
+            component.thread = threading.Thread(
+                target=self.run_component, args=(component,),
+                name=component.name, daemon=True
+            )
+            component.thread.start()
+
+    def stop(self, *args):
+        """Запрос остановки; подходит и как обработчик сигнала."""
+        self.stopping.set()
+
+    def install_signals(self):
+        """Остановка по SIGTERM (перезапуск dyno) и SIGINT."""
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self.stop)
+
+    def shutdown(self):
+        """Остановка компонентов в обратном порядке запуска."""
+        self.stopping.set()
+        deadline = time.monotonic() + self.join_timeout
+        for component in reversed(self.components):
+            if component.stop is not None:
+                try:
+                    component.stop()
+                except Exception as error:
+                    logger.error(f'Не удалось остановить {component.name}: '
+                                 f'{error}')
+            if component.thread is not None:
+                component.thread.join(max(0, deadline - time.monotonic()))
+                if component.thread.is_alive():
+                    logger.warning(f'Компонент {component.name} не '
+                                   'остановился вовремя.')
+
+    def run(self):
+        """
+        Запуск и ожидание остановки в текущем потоке.
+        Возвращает True, если ни один компонент не завершился сбоем.
+        """
+        self.start()
+        if threading.current_thread() is threading.main_thread():
+            self.install_signals()
+        # Ожидание с таймаутом, чтобы главный поток обрабатывал сигналы.
+        while not self.stopping.wait(1):
+            pass
+        self.shutdown()
+        return self.failed is None
+
+    def cpu_times(self):
+        """
+        Процессорное время по компонентам, в секундах.
+        Поток компонента сам учитывает свое время при выходе, время
+        завершившихся вспомогательных потоков берется по последнему
+        замеру.
+        """
+        with self.lock:
+            totals = dict.fromkeys(
+                (component.name for component in self.components), 0.0
+            )
+            alive = {}
+            for thread in threading.enumerate():
+                if thread in self.finished:
+                    continue
+                owner = next((component.name for component in self.components
+                              if component.owns(thread)), None)
+                cpu = None if owner is None else thread_cpu_time(thread)
+                if cpu is not None:
+                    alive[thread] = (owner, cpu)
+            # Ключ - сам объект потока: идентификаторы завершившихся
+            # потоков могут достаться новым.
+            for thread, (owner, cpu) in self.cpu_seen.items():
+                if thread not in alive:
+                    self.cpu_retired[owner] = (
+                        self.cpu_retired.get(owner, 0.0) + cpu
+                    )
+            self.cpu_seen = alive
+            for owner, cpu in alive.values():
+                totals[owner] += cpu
+            for owner, cpu in self.cpu_retired.items():
+                totals[owner] += cpu
+            return totals
+
+    def status(self):
+        """Состояние компонентов и очередей для метрик."""
+        cpu = self.cpu_times()
+        process = time.process_time()
+        return {
+            'uptime': round(time.monotonic() - (self.started or 0), 1),
+            'cpu': {name: round(value, 3) for name, value in cpu.items()},
+            'cpu_other': round(max(0.0, process - sum(cpu.values())), 3),
+            'alive': {component.name: component.thread is not None
+                      and component.thread.is_alive()
+                      for component in self.components},
+            'queues': {item.name: item.stats() for item in self.queues},
+        }
@@ -0,0 +1,131 @@
+"""
+Приоритетное расписание опроса подписок.
+Подписки с работой на проверке, недавним изменением статуса или
+недавней ошибкой опрашиваются чаще простаивающих. Расписание хранится
+в куче: выбор очередной подписки и перепланирование стоят O(log n),
+а общий лимит запросов к API тратится на самые срочные подписки.
+"""
+import heapq
+import itertools
+import time
+
+# Интервалы опроса по умолчанию, в секундах.
+DEFAULT_INTERVALS = {
+    'reviewing': 60,
+    'recent': 120,
+    'error': 180,
+    'idle': 300,
+}
+
+
+class Activity:
+    """Недавняя активность подписки."""
+
+    __slots__ = ('status', 'changed', 'failed')
+
+    def __init__(self):
+        self.status = None
+        self.changed = None
+        self.failed = None
+
+
+class PollScheduler:
+    """
+    Расписание опроса на основе кучи (next_poll, seq, key).
+    При перепланировании старая запись кучи не удаляется, а становится
+    неактуальной и пропускается при извлечении.
+    """
+
+    def __init__(self, keys, intervals=None, recent_window=3600,
+                 budget=None, clock=time.monotonic):
+        self.intervals = dict(DEFAULT_INTERVALS, **(intervals or {}))
+        self.recent_window = recent_window
+        self.budget = budget
+        self.clock = clock
+        self.counter = itertools.count()
+        self.heap = []
+        self.next_polls = {}
+        self.activity = {}
+        now = clock()
+        for key in keys:
+            self.activity[key] = Activity()
+            self.schedule(key, now)
+
+    def schedule(self, key, when):
+        """Назначение времени следующего опроса подписки."""
+        self.next_polls[key] = when
+        heapq.heappush(self.heap, (when, next(self.counter), key))
+        # Неактуальных записей не должно быть больше, чем актуальных.
+        if len(self.heap) > 2 * len(self.next_polls) + 16:
+            self.compact()
+
+    def compact(self):
+        """Пересборка кучи без неактуальных записей."""
+        self.heap = [entry for entry in self.heap
+                     if self.next_polls.get(entry[2]) == entry[0]]
+        heapq.heapify(self.heap)
+
+    def peek(self):
+        """Ближайшая актуальная запись кучи или None."""
+        while self.heap:
+            when, _, key = self.heap[0]
+            if self.next_polls.get(key) == when:
+                return self.heap[0]
+            heapq.heappop(self.heap)
+        return None
+
+    def due(self):
+        """
+        Подписки, которые пора опросить, в порядке срочности.
+        Выдается не больше подписок, чем позволяет лимит запросов;
+        остальные остаются в расписании и будут первыми в следующий раз.
+        """
+        now = self.clock()
+        keys = []
+        while True:
+            entry = self.peek()
+            if entry is None or entry[0] > now:
+                break
+            if self.budget is not None and not self.budget.try_acquire():
+                break
+            heapq.heappop(self.heap)
+            keys.append(entry[2])
+        return keys
+
+    def interval(self, key, now):
+        """Интервал опроса подписки по ее недавней активности."""
+        activity = self.activity[key]
+        if activity.status == 'reviewing':
+            return self.intervals['reviewing']
+        if (activity.changed is not None
+                and now - activity.changed < self.recent_window):
+            return self.intervals['recent']
+        if (activity.failed is not None
+                and now - activity.failed < self.recent_window):
+            return self.intervals['error']
+        return self.intervals['idle']
+
+    def record(self, key, homeworks=(), failed=False):
+        """Учет результата опроса и перепланирование подписки."""
+        now = self.clock()
+        activity = self.activity[key]
+        if homeworks:
+            activity.status = homeworks[0].get('status')
+            activity.changed = now
+        if failed:
+            activity.failed = now
+        self.schedule(key, now + self.interval(key, now))
+
+    def delay(self, limit):
+        """Пауза до следующего опроса, не больше limit секунд."""
+        entry = self.peek()
+        if entry is None:
+            return limit
+        wait = entry[0] - self.clock()
+        if self.budget is not None:
+            wait = max(wait, self.budget.wait_time())
+        return min(max(wait, 0), limit)
+
+    def next_poll_times(self):
+        """Время следующего опроса по подпискам, по часам clock."""
+        return dict(self.next_polls)
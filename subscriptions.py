@@ -0,0 +1,168 @@
+"""
+Подписки чатов на статусы домашних работ.
+Несколько чатов могут следить за одним токеном Практикума: API
+опрашивается один раз на токен за цикл, а результат разделяется
+между всеми подписанными чатами.
+"""
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# Максимальная длина сообщения Telegram, в символах.
+MESSAGE_LIMIT = 4096
+
+
+@dataclass(frozen=True)
+class Subscription:
+    """Подписка чата на статусы работ по токену Практикума."""
+
+    token: str
+    chat_id: str
+
+
+@dataclass(frozen=True)
+class TokenSnapshot:
+    """
+    Результат опроса API по одному токену за цикл.
+    Объект общий для всех подписанных чатов, поэтому он неизменяемый:
+    домашние работы хранятся как кортеж из MappingProxyType. messages -
+    сообщения обо всех новых изменениях статусов; пустой кортеж, если
+    изменений нет. render_error - первая ошибка форматирования: работа
+    с такой ошибкой пропускается, но остается в homeworks и отмечается
+    как обработанная.
+    """
+
+    token: str
+    homeworks: Tuple[MappingProxyType, ...] = ()
+    messages: Tuple[str, ...] = ()
+    current_date: Optional[int] = None
+    error: Optional[Exception] = None
+    render_error: Optional[Exception] = None
+
+
+def parse_subscriptions(raw: str):
+    """
+    Разбор строки подписок вида 'token1:chat1,chat2;token2:chat3'.
+    Пустые элементы и повторы пропускаются.
+    """
+    subscriptions = []
+    for entry in raw.split(';'):
+        token, _, chats = entry.strip().partition(':')
+        if not token or not chats:
+            continue
+        for chat_id in chats.split(','):
+            subscription = Subscription(token, chat_id.strip())
+            if subscription.chat_id and subscription not in subscriptions:
+                subscriptions.append(subscription)
+    return tuple(subscriptions)
+
+
+def load_subscriptions(raw, default_token, default_chat_id):
+    """
+    Получение списка подписок.
+    Если строка подписок не задана, бот работает с единственной
+    подпиской из PRACTICUM_TOKEN и TELEGRAM_CHAT_ID.
+    """
+    if raw:
+        subscriptions = parse_subscriptions(raw)
+        if subscriptions:
+            return subscriptions
+    return (Subscription(default_token, default_chat_id),)
+
+
+def pack_messages(lines, limit=MESSAGE_LIMIT):
+    """
+    Объединение строк в сообщения не длиннее limit символов.
+    Строка длиннее limit делится на части.
+    """
+    messages = []
+    current = ''
+    for line in lines:
+        while len(line) > limit:
+            if current:
+                messages.append(current)
+                current = ''
+            messages.append(line[:limit])
+            line = line[limit:]
+        if not current:
+            current = line
+        elif len(current) + 1 + len(line) <= limit:
+            current = f'{current}\n{line}'
+        else:
+            messages.append(current)
+            current = line
+    if current:
+        messages.append(current)
+    return tuple(messages)
+
+
+def group_by_token(subscriptions: Iterable[Subscription]):
+    """Группирует чаты по токену, сохраняя порядок подписок."""
+    groups: Dict[str, Tuple[str, ...]] = {}
+    for subscription in subscriptions:
+        groups[subscription.token] = (
+            groups.get(subscription.token, ()) + (subscription.chat_id,)
+        )
+    return groups
+
+
+class TokenFanOut:
+    """
+    Слой раздачи результатов опроса API по подписчикам.
+    Каждый уникальный токен опрашивается ровно один раз за цикл,
+    ответ проверяется и форматируется один раз, после чего готовые
+    сообщения переиспользуются для всех чатов этого токена.
+    """
+
+    def __init__(self, subscriptions, fetch: Callable,
+                 check: Callable, render: Callable):
+        self.groups = group_by_token(subscriptions)
+        self.fetch = fetch
+        self.check = check
+        self.render = render
+
+    def chats(self, token):
+        """Чаты, подписанные на токен."""
+        return self.groups.get(token, ())
+
+    def poll_token(self, token, watermarks):
+        """
+        Опрос API по одному токену.
+        Окно запроса и отсеивание уже обработанных работ берутся
+        из отметок подписок (watermark.WatermarkManager). О каждом
+        новом изменении формируется строка, от ранних изменений
+        к поздним: все они будут отмечены как обработанные. Ошибка
+        форматирования одной работы не мешает остальным: иначе окно
+        запроса не сдвинется и ошибка будет повторяться при каждом опросе.
+        """
+        try:
+            response = self.fetch(token, watermarks.from_date(token))
+            homeworks = tuple(
+                MappingProxyType(homework)
+                for homework in watermarks.unseen(token,
+                                                  self.check(response))
+            )
+        except Exception as error:
+            return TokenSnapshot(token, error=error)
+        lines = []
+        render_error = None
+        for homework in sorted(
+            homeworks, key=lambda homework: homework.get('date_updated') or ''
+        ):
+            try:
+                lines.append(self.render(homework))
+            except Exception as error:
+                render_error = render_error or error
+        return TokenSnapshot(token, homeworks, pack_messages(lines),
+                             response.get('current_date'), None, render_error)
+
+    def poll(self, watermarks, tokens=None):
+        """
+        Опрос токенов (по умолчанию всех).
+        Возвращает словарь {токен: TokenSnapshot}; ошибка одного токена
+        сохраняется в его снимке и не прерывает опрос остальных.
+        """
+        return {
+            token: self.poll_token(token, watermarks)
+            for token in (self.groups if tokens is None else tokens)
+        }
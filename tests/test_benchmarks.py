@@ -0,0 +1,201 @@
+"""
+Замеры производительности функций горячего пути.
+Время каждого случая нормируется на калибровочную нагрузку, поэтому
+базовые значения из tests/benchmarks/baseline.json сравнимы между
+машинами. Замеры чувствительны к нагрузке машины, поэтому в обычном
+прогоне случаи только выполняются; сравнение с базой включается
+переменной BENCH. Тогда тест падает, если случай медленнее базы больше
+чем в (1 + BENCH_THRESHOLD) раз. В разделе accepted базы перечислены
+принятые замедления: значение случая до изменения и его причина.
+Проверка: BENCH=1 python -m pytest tests/test_benchmarks.py
+Обновить базу: BENCH_SAVE=1 python -m pytest tests/test_benchmarks.py
+"""
+import itertools
+import json
+import os
+import statistics
+import timeit
+
+import pytest
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'benchmarks',
+                             'baseline.json')
+BENCH_THRESHOLD = float(os.getenv('BENCH_THRESHOLD', 0.5))
+BENCH_SAVE = os.getenv('BENCH_SAVE', '').lower() in ('1', 'true')
+BENCH = BENCH_SAVE or os.getenv('BENCH', '').lower() in ('1', 'true')
+REPEAT = int(os.getenv('BENCH_REPEAT', 9))
+# Минимальная длительность одного замера, в секундах.
+MIN_MEASURE_TIME = 0.02
+SIZES = (0, 1, 100, 10000)
+STATUSES = ('approved', 'reviewing', 'rejected')
+
+
+def loop_count(timer):
+    """Число вызовов, которое занимает не меньше MIN_MEASURE_TIME."""
+    number = 1
+    while timer.timeit(number) < MIN_MEASURE_TIME:
+        number *= 2
+    return number
+
+
+def relative_time(func):
+    """
+    Время вызова в единицах калибровочной нагрузки.
+    Замеры случая и калибровки чередуются, поэтому фоновая нагрузка
+    и смена частоты процессора влияют на оба одинаково; медиана
+    отношений отбрасывает отдельные выбросы.
+    """
+    case, unit = timeit.Timer(func), timeit.Timer(calibration)
+    case_number, unit_number = loop_count(case), loop_count(unit)
+    return statistics.median(
+        (case.timeit(case_number) / case_number)
+        / (unit.timeit(unit_number) / unit_number)
+        for _ in range(REPEAT)
+    )
+
+
+def calibration():
+    """Эталонная нагрузка на чистом Python."""
+    data = {str(i): i for i in range(200)}
+    return sum(data[str(i % 200)] for i in range(2000))
+
+
+def make_response(size):
+    """Синтетический ответ API с size работами."""
+    return {
+        'homeworks': [
+            {'id': i, 'homework_name': f'hw{i}',
+             'status': STATUSES[i % len(STATUSES)],
+             'date_updated': '2020-02-13T14:40:57Z'}
+            for i in range(size)
+        ],
+        'current_date': 1581604857,
+    }
+
+
+class StandInBot:
+
+    def send_message(self, chat_id=None, text=None, **kwargs):
+        pass
+
+
+@pytest.fixture(scope='module')
+def bench():
+    """
+    Замер случая с нормировкой и сравнением с базой.
+    bench(name, func, *args) по аналогии с pytest-benchmark; без BENCH
+    случай выполняется один раз без замера.
+    """
+    with open(BASELINE_PATH, encoding='utf-8') as file:
+        baseline = json.load(file)
+    cases = baseline['cases']
+    results = {}
+
+    def run(name, func, *args):
+        result = func(*args)
+        if not BENCH:
+            return result
+        ratio = relative_time(lambda: func(*args))
+        results[name] = round(ratio, 4)
+        expected = cases.get(name)
+        if not BENCH_SAVE and expected is not None:
+            assert ratio <= expected * (1 + BENCH_THRESHOLD), (
+                f'{name}: {ratio:.4f} при базе {expected:.4f} '
+                f'(допуск +{BENCH_THRESHOLD:.0%})'
+            )
+        return result
+
+    yield run
+    if BENCH_SAVE:
+        cases.update(results)
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as file:
+            json.dump(baseline, file, indent=2, sort_keys=True,
+                      ensure_ascii=False)
+            file.write('\n')
+
+
+def test_accepted_regressions_are_documented():
+    with open(BASELINE_PATH, encoding='utf-8') as file:
+        baseline = json.load(file)
+    for name, accepted in baseline['accepted'].items():
+        assert name in baseline['cases'], (
+            f'Принятое замедление {name} должно относиться к случаю базы'
+        )
+        assert accepted['before'] < baseline['cases'][name]
+        assert accepted['reason'], f'Укажите причину замедления {name}'
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_check_response(bench, size):
+    import homework
+
+    response = make_response(size)
+    homeworks = bench(f'check_response[{size}]', homework.check_response,
+                      response)
+    assert len(homeworks) == size
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_parse_status(bench, size):
+    import homework
+
+    homeworks = make_response(size)['homeworks']
+
+    def parse_all():
+        return [homework.parse_status(item) for item in homeworks]
+
+    assert len(bench(f'parse_status[{size}]', parse_all)) == size
+
+
+@pytest.mark.parametrize('chats', (1, 10))
+def test_deliver(bench, monkeypatch, chats):
+    import homework
+    from delivery import DeliveryExecutor
+    from notifiers import TelegramNotifier
+
+    monkeypatch.setattr(homework.logger, 'disabled', True)
+    delivery = DeliveryExecutor(TelegramNotifier(StandInBot()))
+    try:
+        assert bench(f'deliver[{chats}]', homework.deliver, delivery,
+                     [str(chat_id) for chat_id in range(chats)],
+                     'Изменился статус проверки работы')
+    finally:
+        delivery.shutdown()
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_main_iteration(bench, monkeypatch, size):
+    import homework
+    from delivery import DeliveryExecutor
+    from isolation import IsolatedPoller
+    from notifiers import TelegramNotifier
+    from outbox import Outbox
+    from scheduler import PollScheduler
+    from subscriptions import TokenFanOut, load_subscriptions
+    from watermark import WatermarkManager
+
+    response = make_response(size)
+
+    def fetch(token, from_date):
+        return dict(response, current_date=from_date + 1000)
+
+    monkeypatch.setattr(homework.logger, 'disabled', True)
+    fan_out = TokenFanOut(load_subscriptions(None, 'token', 1), fetch,
+                          homework.check_response, homework.parse_status)
+    # Отметка позже date_updated работ: каждая итерация видит их как
+    # новые, проходит весь путь до рассылки и сразу забывает их.
+    watermarks = WatermarkManager(fan_out.groups, 2 * 10 ** 9, 0)
+    scheduler = PollScheduler(fan_out.groups,
+                              clock=itertools.count(step=1000).__next__)
+    poller = IsolatedPoller(
+        lambda token: fan_out.poll_token(token, watermarks), inline=True,
+        clock=scheduler.clock
+    )
+    delivery = DeliveryExecutor(TelegramNotifier(StandInBot()))
+    outbox = Outbox(':memory:')
+    try:
+        bench(f'main_iteration[{size}]', homework.process_cycle, delivery,
+              fan_out, watermarks, scheduler, poller, outbox)
+    finally:
+        delivery.shutdown()
+        outbox.close()
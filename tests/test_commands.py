@@ -0,0 +1,246 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from commands import (API_ERROR, HELP, NO_DATA, CommandHandler, FetchDeferred,
+                      StatusCache, UpdateListener)
+from subscriptions import TokenSnapshot
+
+OLD = {'id': 1, 'homework_name': 'old', 'status': 'approved',
+       'date_updated': '2020-01-01T00:00:00Z'}
+NEW = {'id': 2, 'homework_name': 'new', 'status': 'reviewing',
+       'date_updated': '2020-02-01T00:00:00Z'}
+
+
+class CountingFetch:
+
+    def __init__(self, homeworks=(OLD,), error=None, delay=0):
+        self.homeworks = list(homeworks)
+        self.error = error
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self, token):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.homeworks
+
+
+def test_cache_coalesces_concurrent_requests():
+    fetch = CountingFetch(delay=0.2)
+    cache = StatusCache(fetch, ttl=60)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.homeworks('t')))
+        for _ in range(20)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert fetch.calls == 1, (
+        'Серия одновременных команд должна давать один запрос к API'
+    )
+    assert results == [[OLD]] * 20
+
+
+def test_cache_ttl_and_poll_results():
+    now = [0]
+    fetch = CountingFetch()
+    cache = StatusCache(fetch, ttl=60, clock=lambda: now[0])
+    assert cache.homeworks('t') == [OLD]
+    now[0] = 50
+    cache.observe(TokenSnapshot('t', (NEW,)))
+    now[0] = 100
+    assert cache.homeworks('t') == [NEW, OLD], (
+        'Результат опроса должен попадать в кэш и продлевать его'
+    )
+    assert fetch.calls == 1
+    now[0] = 200
+    cache.homeworks('t')
+    assert fetch.calls == 2
+
+
+def test_cache_remembers_api_errors():
+    now = [0]
+    fetch = CountingFetch(error=ConnectionError('down'))
+    cache = StatusCache(fetch, ttl=60, clock=lambda: now[0])
+    for _ in range(3):
+        try:
+            cache.homeworks('t')
+        except ConnectionError:
+            pass
+        else:
+            raise AssertionError('Ошибка API должна передаваться вызывающему')
+    assert fetch.calls == 1
+
+    fetch.error = None
+    now[0] = 100
+    assert cache.homeworks('t') == [OLD]
+    fetch.error = ConnectionError('down')
+    now[0] = 200
+    assert cache.homeworks('t') == [OLD], (
+        'При ошибке API нужно отдавать последний полный список'
+    )
+
+
+def test_command_handler():
+    cache = StatusCache(CountingFetch([OLD, NEW]), ttl=60)
+    handler = CommandHandler(cache, {1: ['t']},
+                             lambda homework: homework['homework_name'],
+                             history_limit=10)
+    assert handler.handle(1, '/status') == 'new'
+    assert handler.handle('1', '/history@homework_bot') == 'new\nold'
+    assert handler.handle(1, '/start') == HELP
+    assert handler.handle(1, 'привет') is None
+    assert handler.handle(2, '/status') is None, (
+        'Чатам без подписки бот не отвечает'
+    )
+    empty = CommandHandler(StatusCache(CountingFetch([])), {1: ['t']}, str)
+    assert empty.handle(1, '/status') == NO_DATA
+    broken = CommandHandler(StatusCache(CountingFetch(error=OSError())),
+                            {1: ['t']}, str)
+    assert broken.handle(1, '/status') == API_ERROR
+
+
+def test_update_listener_answers_messages():
+    def update(update_id, chat_id, text):
+        return SimpleNamespace(update_id=update_id, message=SimpleNamespace(
+            chat_id=chat_id, text=text))
+
+    class StandInBot:
+
+        def __init__(self):
+            self.offsets = []
+
+        def get_updates(self, offset=None, timeout=None, **kwargs):
+            self.offsets.append(offset)
+            return [update(10, 1, '/status'),
+                    SimpleNamespace(update_id=11, message=None),
+                    update(12, 2, '/status')]
+
+    replies = []
+    handler = SimpleNamespace(
+        handle=lambda chat_id, text: 'ok' if chat_id == 1 else None
+    )
+    bot = StandInBot()
+    listener = UpdateListener(bot, handler,
+                              lambda *reply: replies.append(reply))
+    assert listener.poll() == 2
+    listener.pool.shutdown(wait=True)
+    assert replies == [(1, 'ok')]
+    assert listener.offset == 13, (
+        'Следующий запрос должен подтверждать полученные обновления'
+    )
+
+
+def test_replies_use_listener_bot_and_rate_limit(monkeypatch):
+    import homework
+    from delivery import RateLimiter
+    from subscriptions import parse_subscriptions
+
+    class StandInBot:
+
+        def __init__(self, token=None, **kwargs):
+            self.sent = []
+
+        def send_message(self, chat_id=None, text=None, **kwargs):
+            self.sent.append((chat_id, text))
+
+    monkeypatch.setattr(homework.telegram, 'Bot', StandInBot)
+    limiter = RateLimiter(rate=1000)
+    acquired = []
+    monkeypatch.setattr(limiter, 'acquire', lambda: acquired.append(1))
+    listener = homework.create_commands(parse_subscriptions('t:1'),
+                                        rate_limiter=limiter)
+    listener.reply('1', 'ok')
+    assert listener.bot.sent == [('1', 'ok')], (
+        'Ответ на команду должен уходить через бота, получившего команду'
+    )
+    assert acquired == [1], 'Ответы должны учитываться в лимите Telegram'
+
+
+def test_command_fetch_has_no_poll_side_effects(monkeypatch):
+    import homework
+    from delivery import RateLimiter
+    from exceptions import UnauthorizedError
+    from isolation import IsolatedPoller
+
+    requests = []
+
+    def get(url, headers=None, params=None, timeout=None):
+        requests.append(headers)
+        return SimpleNamespace(status_code=200,
+                               json=lambda: {'homeworks': [OLD]})
+
+    beats = []
+    monkeypatch.setattr(homework.requests, 'get', get)
+    monkeypatch.setattr(homework.WATCHDOG, 'beat', beats.append)
+    monkeypatch.setattr(homework, 'EXCEPTIONS', {})
+    now = [0]
+    budget = RateLimiter(rate=1, burst=1, clock=lambda: now[0])
+    poller = IsolatedPoller(
+        lambda token: TokenSnapshot(token, error=UnauthorizedError('401')),
+        error_budget=1, inline=True, clock=lambda: now[0]
+    )
+
+    assert homework.get_homeworks('t', budget, poller) == [OLD]
+    assert beats == [], 'Команды не должны отмечать опрос API'
+    assert homework.EXCEPTIONS == {}
+    try:
+        homework.get_homeworks('t', budget, poller)
+    except FetchDeferred:
+        pass
+    else:
+        raise AssertionError('Команды должны расходовать общий лимит API')
+
+    now[0] = 10
+    poller.submit(['t'])
+    list(poller.collect(timeout=0))
+    assert poller.is_quarantined('t')
+    try:
+        homework.get_homeworks('t', budget, poller)
+    except FetchDeferred:
+        pass
+    else:
+        raise AssertionError('Токен в карантине не должен запрашиваться')
+    assert len(requests) == 1
+
+
+def test_cache_answers_from_poll_results_when_refresh_fails():
+    cache = StatusCache(CountingFetch(error=FetchDeferred('limit')), ttl=60)
+    cache.observe(TokenSnapshot('t', (NEW,)))
+    assert cache.homeworks('t') == [NEW], (
+        'Без полного списка команды должны отвечать по результатам опроса'
+    )
+
+
+def test_command_refreshes_have_own_budget(monkeypatch, tmp_path):
+    import homework
+
+    class StandInBot:
+
+        def __init__(self, token=None, **kwargs):
+            pass
+
+    def get(url, headers=None, params=None, timeout=None):
+        return SimpleNamespace(status_code=200,
+                               json=lambda: {'homeworks': [OLD]})
+
+    monkeypatch.setattr(homework.telegram, 'Bot', StandInBot)
+    monkeypatch.setattr(homework.requests, 'get', get)
+    monkeypatch.setattr(homework, 'COMMANDS', True)
+    monkeypatch.setattr(homework, 'OUTBOX_PATH',
+                        str(tmp_path / 'outbox.sqlite3'))
+    app = homework.build()
+    try:
+        while app.scheduler.budget.try_acquire():
+            pass
+        assert app.commands.handler.cache.homeworks(
+            homework.PRACTICUM_TOKEN
+        ) == [OLD], 'Опрос не должен расходовать лимит запросов команд'
+    finally:
+        app.poller.shutdown()
+        app.outbox.close()
@@ -0,0 +1,85 @@
+import threading
+import time
+
+from delivery import DeliveryExecutor, RateLimiter
+from notifiers import Notifier
+
+
+class CallbackNotifier(Notifier):
+
+    def __init__(self, callback, batch_size=1):
+        self.callback = callback
+        self.batch_size = batch_size
+        self.batches = []
+
+    def send(self, chat_id, text):
+        self.callback(chat_id, text)
+
+    def send_batch(self, items):
+        self.batches.append(items)
+        super().send_batch(items)
+
+
+def test_delivery_collects_per_chat_results():
+    def send(chat_id, message):
+        if chat_id == 'bad':
+            raise ValueError(chat_id)
+
+    delivery = DeliveryExecutor(CallbackNotifier(send), max_workers=4,
+                                retries=0)
+    try:
+        result = delivery.deliver('text', ('a', 'bad', 'b'))
+    finally:
+        delivery.shutdown()
+    assert sorted(result.delivered) == ['a', 'b']
+    assert isinstance(result.failed['bad'], ValueError)
+    assert not result, (
+        'Результат с неудачными чатами должен считаться неуспешным'
+    )
+
+
+def test_delivery_is_parallel():
+    barrier = threading.Barrier(3, timeout=5)
+
+    def send(chat_id, message):
+        barrier.wait()
+
+    delivery = DeliveryExecutor(CallbackNotifier(send), max_workers=3)
+    try:
+        started = time.monotonic()
+        result = delivery.deliver('text', (1, 2, 3))
+    finally:
+        delivery.shutdown()
+    assert result and time.monotonic() - started < 5, (
+        'Сообщения в разные чаты должны отправляться параллельно'
+    )
+
+
+def test_delivery_batches_and_retries():
+    failures = [ValueError('сбой')]
+
+    def send(chat_id, message):
+        if failures:
+            raise failures.pop()
+
+    notifier = CallbackNotifier(send, batch_size=2)
+    delivery = DeliveryExecutor(notifier, max_workers=2, retries=1,
+                                sleep=lambda seconds: None)
+    try:
+        result = delivery.deliver('text', (1, 2, 3))
+    finally:
+        delivery.shutdown()
+    assert result, 'Неудачная пачка должна отправляться повторно'
+    assert sorted(len(batch) for batch in notifier.batches) == [1, 2, 2], (
+        'Чаты должны делиться на пачки по batch_size'
+    )
+
+
+def test_rate_limiter_delays_over_burst():
+    now = [0.0]
+    limiter = RateLimiter(rate=2, burst=2, clock=lambda: now[0])
+    assert limiter.reserve() == 0
+    assert limiter.reserve() == 0
+    assert limiter.reserve() == 0.5
+    now[0] = 1.5
+    assert limiter.reserve() == 0
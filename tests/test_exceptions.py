@@ -0,0 +1,61 @@
+import pytest
+
+import exceptions
+
+
+ERRORS = [
+    exceptions.NotFoundError, exceptions.ResponseTypeError,
+    exceptions.ResponseValueError, exceptions.NotListResultError,
+    exceptions.CustomKeyError, exceptions.StatusError,
+    exceptions.UpdateError,
+]
+
+
+@pytest.mark.parametrize('error_class', ERRORS)
+def test_error_text_and_message(error_class):
+    error = error_class('текст ошибки')
+    assert str(error) == 'текст ошибки', (
+        f'str() для {error_class.__name__} должен возвращать текст ошибки'
+    )
+    assert error.message.endswith('текст ошибки')
+    assert isinstance(error.code, exceptions.ErrorCode)
+
+
+def test_error_codes_are_unique():
+    codes = [error_class.code for error_class in ERRORS]
+    assert len(set(codes)) == len(codes)
+
+
+def test_builtin_bases_are_kept():
+    assert issubclass(exceptions.ResponseTypeError, TypeError)
+    assert issubclass(exceptions.CustomKeyError, KeyError)
+    assert issubclass(exceptions.StatusError, KeyError)
+
+
+def test_handle_error_dispatches_by_code(monkeypatch):
+    import homework
+
+    sent = []
+    monkeypatch.setattr(homework, 'EXCEPTIONS', {})
+    monkeypatch.setattr(homework, 'deliver',
+                        lambda delivery, chat_ids, message:
+                        sent.append(message) or True)
+    monkeypatch.setattr(homework.logger, 'disabled', True)
+
+    homework.handle_error(None, 't', ['1'], exceptions.NotFoundError('сеть'))
+    homework.handle_error(None, 't', ['1'],
+                          exceptions.UnauthorizedError('токен'))
+    assert sent == [
+        exceptions.NotFoundError('сеть').message,
+        exceptions.UnauthorizedError('токен').message,
+    ], 'Ошибки с разными кодами должны различаться, даже при наследовании'
+
+    homework.handle_error(None, 't', ['1'], exceptions.NotFoundError('сеть'))
+    assert len(sent) == 2, 'Повтор ошибки с тем же кодом не отправляется'
+
+    homework.handle_error(None, 't', ['1'], homework.NO_UPDATES)
+    assert sent[-1] == homework.NO_UPDATES.text, (
+        'Сообщение об отсутствии обновлений отправляется без префикса'
+    )
+    homework.handle_error(None, 't', ['1'], ValueError('не ошибка бота'))
+    assert len(sent) == 3, 'Прочие исключения только логируются'
@@ -0,0 +1,80 @@
+import json
+import urllib.error
+import urllib.request
+
+from health import Watchdog, serve_health
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_watchdog_lag():
+    clock = FakeClock()
+    watchdog = Watchdog(max_lag=10, clock=clock)
+    clock.now = 5
+    watchdog.beat('cycle')
+    watchdog.beat('poll')
+    clock.now = 12
+    assert watchdog.lag('cycle') == 7
+    assert watchdog.lag('send') == 12, (
+        'Без отметок задержка считается с момента запуска'
+    )
+    assert watchdog.is_ready()
+    clock.now = 16
+    assert watchdog.is_stuck(), (
+        'Цикл без отметок дольше max_lag должен считаться зависшим'
+    )
+    assert not watchdog.is_ready()
+
+
+def test_health_endpoints():
+    clock = FakeClock()
+    watchdog = Watchdog(max_lag=10, clock=clock)
+    watchdog.start(interval=3600)
+    server = serve_health(watchdog, '127.0.0.1', 0)
+    url = f'http://127.0.0.1:{server.server_address[1]}'
+    try:
+        with urllib.request.urlopen(f'{url}/healthz') as response:
+            assert json.load(response)['alive']
+        with urllib.request.urlopen(f'{url}/readyz') as response:
+            assert response.status == 200
+        clock.now = 60
+        for path in ('/readyz', '/healthz'):
+            try:
+                urllib.request.urlopen(f'{url}{path}')
+            except urllib.error.HTTPError as error:
+                assert error.code == 503
+            else:
+                assert False, (
+                    f'{path} должен отвечать 503 при зависании цикла'
+                )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_busy_health_port_is_not_fatal(monkeypatch):
+    import socket
+
+    import homework
+
+    errors = []
+    monkeypatch.setattr(homework.logger, 'error', errors.append)
+    with socket.socket() as busy:
+        busy.bind(('127.0.0.1', 0))
+        busy.listen()
+        monkeypatch.setattr(homework, 'HEALTH_HOST', '127.0.0.1')
+        monkeypatch.setattr(homework, 'HEALTH_PORT',
+                            str(busy.getsockname()[1]))
+        assert homework.create_health({}) is None, (
+            'Занятый порт не должен мешать запуску бота'
+        )
+    assert errors
+    monkeypatch.setattr(homework, 'HEALTH_PORT', '')
+    assert homework.create_health({}) is None
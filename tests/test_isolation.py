@@ -0,0 +1,122 @@
+import threading
+import time
+
+from exceptions import NotFoundError, UnauthorizedError
+from isolation import IsolatedPoller
+from subscriptions import TokenSnapshot
+
+TOKENS = [f'token{i}' for i in range(200)]
+# 1% отравленных подписок: зависший запрос и отозванный токен.
+HUNG, REVOKED = TOKENS[17], TOKENS[123]
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def make_poll(release):
+    def poll(token):
+        if token == HUNG:
+            release.wait(10)
+        if token == REVOKED:
+            return TokenSnapshot(token, error=UnauthorizedError('401'))
+        return TokenSnapshot(token)
+    return poll
+
+
+def run_cycle(poller, tokens):
+    started = time.monotonic()
+    latencies = {}
+    poller.submit(tokens)
+    for token, snapshot in poller.collect(timeout=1):
+        latencies[token] = time.monotonic() - started
+    return latencies
+
+
+def test_poisoned_subscriptions_do_not_delay_healthy_ones():
+    healthy = [token for token in TOKENS if token not in (HUNG, REVOKED)]
+    release = threading.Event()
+
+    clean = IsolatedPoller(make_poll(release), max_workers=16)
+    poisoned = IsolatedPoller(make_poll(release), max_workers=16)
+    try:
+        baseline = run_cycle(clean, healthy)
+        latencies = run_cycle(poisoned, TOKENS)
+    finally:
+        release.set()
+        clean.shutdown()
+        poisoned.shutdown()
+
+    assert set(healthy) <= set(latencies), (
+        'Все здоровые подписки должны быть опрошены в том же цикле'
+    )
+    assert HUNG not in latencies
+    assert poisoned.is_polling(HUNG), (
+        'Зависший опрос должен остаться в работе, не блокируя цикл'
+    )
+    slowest = max(latencies[token] for token in healthy)
+    assert slowest < max(baseline.values()) + 0.5, (
+        'Отравленные подписки не должны задерживать здоровые'
+    )
+
+
+def test_revoked_token_is_quarantined():
+    clock = FakeClock()
+    poller = IsolatedPoller(make_poll(threading.Event()), error_budget=3,
+                            backoff=10, quarantine=3600, inline=True,
+                            clock=clock)
+    for attempt in range(3):
+        clock.now = poller.ready_at(REVOKED)
+        assert poller.submit([REVOKED, TOKENS[0]]) == []
+        results = dict(poller.collect(timeout=0))
+        assert isinstance(results[REVOKED].error, UnauthorizedError)
+    assert poller.is_quarantined(REVOKED)
+    assert poller.ready_at(REVOKED) == clock.now + 3600
+    assert poller.submit([REVOKED, TOKENS[0]]) == [REVOKED], (
+        'Токен в карантине не должен опрашиваться'
+    )
+    assert poller.ready_at(TOKENS[0]) == 0, (
+        'Сбои одного токена не должны влиять на другие'
+    )
+
+
+def test_transient_failures_only_back_off():
+    clock = FakeClock()
+
+    def poll(token):
+        return TokenSnapshot(token, error=NotFoundError('503'))
+
+    poller = IsolatedPoller(poll, error_budget=2, backoff=10,
+                            max_backoff=40, inline=True, clock=clock)
+    for attempt in range(6):
+        clock.now = poller.ready_at(TOKENS[0])
+        poller.submit([TOKENS[0]])
+        list(poller.collect(timeout=0))
+    assert not poller.is_quarantined(TOKENS[0]), (
+        'Недоступность API не должна отправлять токен в карантин'
+    )
+    assert poller.ready_at(TOKENS[0]) == clock.now + 40
+
+
+def test_hung_poll_times_out_with_backoff():
+    clock = FakeClock()
+    release = threading.Event()
+    poller = IsolatedPoller(make_poll(release), timeout=5, backoff=10,
+                            clock=clock)
+    try:
+        poller.submit([HUNG])
+        assert list(poller.collect(timeout=0.05)) == []
+        clock.now = 6
+        assert list(poller.collect(timeout=0.05)) == []
+        assert poller.ready_at(HUNG) == 16, (
+            'Превышение таймаута должно считаться сбоем с паузой'
+        )
+        assert poller.submit([HUNG]) == [HUNG]
+    finally:
+        release.set()
+        poller.shutdown()
@@ -0,0 +1,86 @@
+import io
+import json
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+
+from notifiers import FileNotifier, StreamNotifier, WebhookNotifier
+
+
+def test_stream_notifier_writes_json_lines():
+    stream = io.StringIO()
+    StreamNotifier(stream).send_batch([(1, 'раз'), (2, 'два\nстроки')])
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert lines == [{'chat_id': 1, 'text': 'раз'},
+                     {'chat_id': 2, 'text': 'два\nстроки'}]
+
+
+def test_file_notifier_appends(tmp_path):
+    path = tmp_path / 'messages.jsonl'
+    for text in ('раз', 'два'):
+        notifier = FileNotifier(path)
+        notifier.send(1, text)
+        notifier.close()
+    assert len(path.read_text(encoding='utf-8').splitlines()) == 2
+
+
+def test_webhook_notifier_sends_batch_in_one_request():
+    payloads = []
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_POST(self):
+            length = int(self.headers['Content-Length'])
+            payloads.append(json.loads(self.rfile.read(length)))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    notifier = WebhookNotifier(f'http://127.0.0.1:{server.server_port}/',
+                               timeout=5)
+    try:
+        notifier.send_batch([(1, 'a'), (2, 'b')])
+        notifier.send(3, 'c')
+    finally:
+        notifier.close()
+        server.shutdown()
+        server.server_close()
+    assert payloads == [
+        {'messages': [{'chat_id': 1, 'text': 'a'},
+                      {'chat_id': 2, 'text': 'b'}]},
+        {'messages': [{'chat_id': 3, 'text': 'c'}]},
+    ], 'Одиночное сообщение должно уходить в том же формате, что и пачка'
+
+
+def test_telegram_bot_pool_matches_delivery_workers(monkeypatch):
+    import homework
+
+    bots = []
+    monkeypatch.setattr(homework.telegram, 'Bot',
+                        lambda **kwargs: bots.append(kwargs) or kwargs)
+    monkeypatch.setattr(homework, 'NOTIFIER', 'telegram')
+    monkeypatch.setattr(homework, 'DELIVERY_WORKERS', 8)
+    homework.create_notifier()
+    assert bots[0]['request'].con_pool_size > 8, (
+        'Пул соединений бота должен покрывать все потоки рассылки'
+    )
+
+
+def test_notifier_misconfiguration_fails_at_startup(monkeypatch):
+    import homework
+
+    monkeypatch.setattr(homework.logger, 'critical', lambda message: None)
+    for notifier, url in (('webhook', None), ('telgram', None)):
+        monkeypatch.setattr(homework, 'NOTIFIER', notifier)
+        monkeypatch.setattr(homework, 'WEBHOOK_URL', url)
+        try:
+            homework.create_notifier()
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(
+                f'NOTIFIER={notifier} без настроек должен останавливать запуск'
+            )
@@ -0,0 +1,170 @@
+import sqlite3
+
+from delivery import DeliveryExecutor
+from notifiers import Notifier
+from outbox import DROPPED, Outbox
+from watermark import Watermark
+
+HOMEWORK = {'id': 1, 'homework_name': 'hw', 'status': 'reviewing',
+            'date_updated': '2020-02-13T14:40:57Z'}
+
+
+class ListNotifier(Notifier):
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.sent = []
+
+    def send(self, chat_id, text):
+        if chat_id in self.failing:
+            raise ConnectionError(chat_id)
+        self.sent.append((chat_id, text))
+
+
+def test_outbox_survives_restart(tmp_path):
+    path = str(tmp_path / 'outbox.sqlite3')
+    outbox = Outbox(path)
+    first, second = outbox.append(['1', '2'], ['text'],
+                                  {'token': {'mark': 10}})
+    outbox.complete([first[0]])
+    outbox.close()
+
+    outbox = Outbox(path)
+    try:
+        assert outbox.pending() == [second], (
+            'Недоставленная запись должна пережить перезапуск'
+        )
+        assert outbox.load_state('token') == {'mark': 10}
+        assert outbox.load_state('other') is None
+    finally:
+        outbox.close()
+    with sqlite3.connect(path) as connection:
+        keys = [row[0] for row in connection.execute('SELECT key FROM state')]
+        mode = connection.execute('PRAGMA journal_mode').fetchone()[0]
+    assert 'token' not in keys, 'Токен не должен храниться в журнале'
+    assert mode == 'wal'
+
+
+def entry_status(outbox, entry_id):
+    return outbox.connection.execute(
+        'SELECT status FROM outbox WHERE id = ?', (entry_id,)
+    ).fetchone()[0]
+
+
+def test_outbox_retries_with_backoff():
+    now = [0]
+    outbox = Outbox(':memory:', max_attempts=4, clock=lambda: now[0],
+                    backoff=10, max_backoff=25)
+    (entry,) = outbox.append(['1'], ['text'])
+    retries = []
+    for attempt in range(3):
+        outbox.complete([], [entry[0]])
+        assert outbox.pending() == [], (
+            'Запись не должна повторяться до окончания паузы'
+        )
+        delay = 0
+        while not outbox.pending():
+            delay += 1
+            now[0] += 1
+        retries.append(delay)
+    assert retries == [10, 20, 25], (
+        'Пауза между повторами должна расти экспоненциально до предела'
+    )
+    outbox.complete([], [entry[0]])
+    now[0] += 100
+    assert outbox.pending() == []
+    assert entry_status(outbox, entry[0]) == DROPPED
+
+
+def test_outbox_drops_old_entries():
+    now = [0]
+    outbox = Outbox(':memory:', clock=lambda: now[0], backoff=10,
+                    max_age=3600)
+    (entry,) = outbox.append(['1'], ['text'])
+    outbox.complete([], [entry[0]])
+    assert entry_status(outbox, entry[0]) != DROPPED, (
+        'Несколько быстрых сбоев подряд не должны отбрасывать запись'
+    )
+    now[0] = 3600
+    outbox.complete([], [entry[0]])
+    assert entry_status(outbox, entry[0]) == DROPPED
+
+
+def test_outbox_adds_retry_column(tmp_path):
+    path = str(tmp_path / 'outbox.sqlite3')
+    with sqlite3.connect(path) as connection:
+        connection.execute(
+            'CREATE TABLE outbox (id INTEGER PRIMARY KEY, chat_id TEXT '
+            'NOT NULL, text TEXT NOT NULL, created REAL NOT NULL, attempts '
+            'INTEGER NOT NULL DEFAULT 0, status INTEGER NOT NULL DEFAULT 0)'
+        )
+        connection.execute("INSERT INTO outbox (chat_id, text, created) "
+                           "VALUES ('1', 'text', 0)")
+    connection.close()
+    outbox = Outbox(path)
+    try:
+        assert [row[1:] for row in outbox.pending()] == [('1', 'text')], (
+            'Журнал прежнего формата должен читаться после обновления'
+        )
+    finally:
+        outbox.close()
+
+
+def test_outbox_prune_keeps_pending():
+    now = [100]
+    outbox = Outbox(':memory:', clock=lambda: now[0])
+    delivered, pending = outbox.append(['1', '2'], ['text'])
+    outbox.complete([delivered[0]])
+    now[0] = 200
+    outbox.prune(150)
+    count = outbox.connection.execute(
+        'SELECT COUNT(*) FROM outbox').fetchone()[0]
+    assert count == 1
+    assert outbox.pending() == [pending]
+
+
+def test_watermark_dump_restore():
+    watermark = Watermark(start=0, overlap=60)
+    watermark.commit([HOMEWORK], current_date=1581604867)
+    restored = Watermark(start=2 * 10 ** 9, overlap=60)
+    restored.restore(watermark.dump())
+    assert restored.mark == watermark.mark
+    assert restored.unseen([HOMEWORK]) == [], (
+        'Восстановленная отметка должна помнить обработанные изменения'
+    )
+
+
+def test_replay_delivers_pending_entries():
+    import homework
+
+    now = [0]
+    outbox = Outbox(':memory:', clock=lambda: now[0])
+    outbox.append(['1', '2'], ['status'])
+    outbox.append(['1'], ['other'])
+    notifier = ListNotifier(failing={'2'})
+    delivery = DeliveryExecutor(notifier, retries=0)
+    try:
+        homework.replay_outbox(delivery, outbox)
+        assert sorted(notifier.sent) == [('1', 'other'), ('1', 'status')]
+        assert outbox.pending() == [], (
+            'Недоставленная запись должна ждать паузы перед повтором'
+        )
+
+        notifier.failing.clear()
+        now[0] = outbox.backoff
+        assert [row[1:] for row in outbox.pending()] == [('2', 'status')]
+        homework.replay_outbox(delivery, outbox)
+    finally:
+        delivery.shutdown()
+    assert ('2', 'status') in notifier.sent
+    assert outbox.pending() == []
+
+
+def test_complete_marks_large_batches():
+    outbox = Outbox(':memory:')
+    entries = outbox.append([str(chat_id) for chat_id in range(1200)],
+                            ['text'])
+    outbox.complete([entry[0] for entry in entries])
+    assert outbox.pending() == [], (
+        'Пачка больше лимита параметров SQLite должна отмечаться целиком'
+    )
@@ -0,0 +1,84 @@
+import os
+import threading
+
+from profiling import CycleProfiler
+
+
+def work(n):
+    return sum(i * i for i in range(n))
+
+
+def test_disabled_profiler_is_passthrough():
+    profiler = CycleProfiler(enabled=False)
+    assert profiler.wrap('work', work) is work
+    with profiler.cycle(), profiler.span('work'):
+        work(10)
+    assert not profiler.stages
+
+
+def test_profiler_dump(tmp_path):
+    profiler = CycleProfiler(enabled=True, sample_every=2,
+                             output_dir=str(tmp_path))
+    timed_work = profiler.wrap('work', work)
+    for _ in range(4):
+        with profiler.cycle():
+            timed_work(20000)
+    assert profiler.stages['cycle'].count == 4
+    assert profiler.stages['work'].count == 4
+
+    prefix = profiler.dump()
+    for suffix in ('.spans.txt', '.pstats', '.collapsed'):
+        assert os.path.exists(prefix + suffix), (
+            f'Профиль должен выгружаться в файл {suffix}'
+        )
+    with open(prefix + '.collapsed') as file:
+        lines = file.read().splitlines()
+    assert any(':work;' in line for line in lines), (
+        'collapsed-файл должен содержать стеки профилируемой функции'
+    )
+
+
+def test_profiler_covers_worker_threads(tmp_path):
+    profiler = CycleProfiler(enabled=True, sample_every=1,
+                             output_dir=str(tmp_path))
+    timed_work = profiler.wrap('work', work)
+    with profiler.cycle():
+        threads = [threading.Thread(target=timed_work, args=(20000,))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert profiler.stages['work'].count == 8, (
+        'Замеры из разных потоков не должны теряться'
+    )
+    assert profiler.stats is not None
+    assert any(func[2] == 'work' for func in profiler.stats.stats), (
+        'Этапы потоков опроса должны попадать в профиль цикла'
+    )
+
+
+def test_profiling_errors_do_not_reach_stage(monkeypatch, tmp_path):
+    import cProfile
+
+    class BusyProfile(cProfile.Profile):
+        """Профиль, который нельзя включить (как второй на Python 3.12+)."""
+
+        def enable(self):
+            raise ValueError('Another profiling tool is already active')
+
+    profiler = CycleProfiler(enabled=True, sample_every=1,
+                             output_dir=str(tmp_path))
+    timed_work = profiler.wrap('work', work)
+    with profiler.cycle():
+        monkeypatch.setattr(cProfile, 'Profile', BusyProfile)
+        results = []
+        thread = threading.Thread(
+            target=lambda: results.append(timed_work(10))
+        )
+        thread.start()
+        thread.join()
+    assert results == [work(10)], (
+        'Сбой профилирования не должен прерывать этап опроса'
+    )
+    assert profiler.stages['work'].count == 1
@@ -0,0 +1,135 @@
+import threading
+import time
+
+from outbox import Outbox
+from runner import BoundedQueue, Component, DeliveryWorker, Runtime
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'Условие не выполнилось вовремя'
+        time.sleep(0.01)
+
+
+def test_bounded_queue_backpressure():
+    stopping = threading.Event()
+    bounded = BoundedQueue('test', maxsize=1, poll_interval=0.01)
+    assert bounded.put('a', stopping)
+    producer = threading.Thread(target=bounded.put, args=('b', stopping))
+    producer.start()
+    time.sleep(0.1)
+    assert producer.is_alive(), (
+        'Производитель должен ждать места в заполненной очереди'
+    )
+    assert bounded.get_batch(10, timeout=1) == ['a']
+    producer.join(1)
+    assert bounded.get_batch(10, timeout=1) == ['b']
+    assert bounded.stats()['blocked'] > 0
+
+    bounded.put('c', stopping)
+    stopping.set()
+    assert not bounded.put('d', stopping), (
+        'При остановке ожидание места должно прерываться'
+    )
+
+
+def test_delivery_worker_batches_and_replays():
+    now = [0]
+    outbox = Outbox(':memory:', clock=lambda: now[0])
+    sent = []
+    failing = {'2'}
+
+    def send(entries):
+        sent.append(entries)
+        outbox.complete(
+            [entry_id for entry_id, chat_id, _ in entries
+             if chat_id not in failing],
+            [entry_id for entry_id, chat_id, _ in entries
+             if chat_id in failing],
+        )
+
+    worker = DeliveryWorker(outbox, send, replay_interval=0)
+    worker.publish(['1', '2'], ['first'])
+    worker.publish(['1'], ['second'])
+    worker.replay()
+    assert sent == [], 'Записи из очереди не должны досылаться повторно'
+
+    worker.step(timeout=0)
+    assert [len(entries) for entries in sent] == [3], (
+        'Записи из очереди должны доставляться одной пачкой'
+    )
+    assert not worker.in_flight
+
+    failing.clear()
+    now[0] = outbox.backoff
+    worker.step(timeout=0)
+    assert [chat_id for _, chat_id, _ in sent[-1]] == ['2']
+    assert outbox.pending() == []
+
+
+def test_runtime_shared_lifecycle_and_cpu():
+    def busy(stopping):
+        while not stopping.is_set():
+            sum(range(1000))
+
+    def broken(stopping):
+        stopping.wait(0.3)
+        raise RuntimeError('сбой')
+
+    runtime = Runtime([Component('busy', busy),
+                       Component('idle', lambda stopping: stopping.wait()),
+                       Component('broken', broken)], join_timeout=5)
+    assert runtime.run() is False, 'Сбой компонента должен завершать работу'
+    assert isinstance(runtime.failed, RuntimeError)
+    assert not any(runtime.status()['alive'].values())
+    cpu = runtime.cpu_times()
+    assert cpu['busy'] > 0.05
+    assert cpu['idle'] < cpu['busy'] / 10, (
+        'Время занятого потока не должно приписываться другим компонентам'
+    )
+
+
+def test_run_components(monkeypatch, tmp_path):
+    import homework
+    from test_soak import StandInApi, StandInBot, prepare
+
+    bots = []
+
+    def make_bot(token=None, **kwargs):
+        bots.append(StandInBot())
+        return bots[-1]
+
+    runtimes = []
+
+    def make_runtime(*args, **kwargs):
+        runtimes.append(Runtime(*args, **kwargs))
+        return runtimes[-1]
+
+    path = str(tmp_path / 'outbox.sqlite3')
+    with open(tmp_path / 'log', 'w') as log:
+        prepare(homework, StandInApi(), log, monkeypatch.setattr)
+        monkeypatch.setattr(homework.telegram, 'Bot', make_bot)
+        monkeypatch.setattr(homework, 'OUTBOX_PATH', path)
+        monkeypatch.setattr(homework, 'Runtime', make_runtime)
+        result = []
+        thread = threading.Thread(target=lambda: result.append(homework.run()))
+        thread.start()
+        try:
+            wait_for(lambda: bots and bots[0].sent)
+            status = runtimes[0].status()
+        finally:
+            wait_for(lambda: runtimes)
+            runtimes[0].stop()
+            thread.join(15)
+    assert result == [True]
+    assert set(status['cpu']) == {'delivery', 'poller', 'checkpoint'}
+    assert status['queues']['delivery']['puts'] >= 1
+    outbox = Outbox(path)
+    try:
+        assert outbox.pending() == []
+        assert outbox.load_state('token') is not None, (
+            'При остановке состояние подписок должно сохраняться'
+        )
+    finally:
+        outbox.close()
@@ -0,0 +1,80 @@
+from delivery import RateLimiter
+from scheduler import PollScheduler
+
+INTERVALS = {'reviewing': 10, 'recent': 20, 'error': 30, 'idle': 100}
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_active_subscriptions_are_polled_first():
+    clock = FakeClock()
+    scheduler = PollScheduler(['idle', 'review', 'broken'], INTERVALS,
+                              clock=clock)
+    assert sorted(scheduler.due()) == ['broken', 'idle', 'review']
+    scheduler.record('idle')
+    scheduler.record('review', [{'status': 'reviewing'}])
+    scheduler.record('broken', failed=True)
+    assert scheduler.next_poll_times() == {
+        'idle': 100, 'review': 10, 'broken': 30
+    }
+    clock.now = 35
+    assert scheduler.due() == ['review', 'broken'], (
+        'Подписки должны выдаваться в порядке срочности'
+    )
+    scheduler.record('review')
+    assert scheduler.next_poll_times()['review'] == 45, (
+        'Работа на проверке должна опрашиваться часто и без новых изменений'
+    )
+
+
+def test_budget_limits_polls():
+    clock = FakeClock()
+    budget = RateLimiter(rate=1, burst=2, clock=clock)
+    scheduler = PollScheduler(range(5), INTERVALS, budget=budget,
+                              clock=clock)
+    assert scheduler.due() == [0, 1]
+    assert scheduler.delay(limit=300) == 1
+    clock.now = 1
+    assert scheduler.due() == [2], (
+        'Оставшиеся подписки должны ждать пополнения лимита'
+    )
+
+
+def test_default_budget_keeps_baseline_rate(monkeypatch):
+    import homework
+
+    monkeypatch.setattr(homework, 'API_REQUESTS_PER_MINUTE', None)
+    clock = FakeClock()
+    tokens = range(10)
+    scheduler = PollScheduler(tokens, INTERVALS,
+                              budget=homework.create_budget(10, clock),
+                              clock=clock)
+    polls = 0
+    for second in range(3000):
+        clock.now = second
+        for key in scheduler.due():
+            polls += 1
+            scheduler.record(key, [{'status': 'reviewing'}])
+    assert polls <= len(tokens) * (3000 // homework.RETRY_TIME + 1), (
+        'По умолчанию запросов к API не должно быть больше, чем при '
+        'опросе каждого токена раз в RETRY_TIME'
+    )
+    monkeypatch.setattr(homework, 'API_REQUESTS_PER_MINUTE', 0)
+    assert homework.create_budget(10, clock) is None
+
+
+def test_reschedule_keeps_heap_bounded():
+    clock = FakeClock()
+    scheduler = PollScheduler(range(10), INTERVALS, clock=clock)
+    for step in range(1000):
+        clock.now = step
+        scheduler.record(step % 10)
+    assert len(scheduler.heap) <= 2 * 10 + 16
+    assert len(scheduler.next_poll_times()) == 10
@@ -0,0 +1,185 @@
+"""
+Проверка работы основного цикла на большом числе итераций.
+Цикл main() крутится против локальных заглушек API и Telegram без
+реальных пауз, а рост памяти отслеживается по RSS и tracemalloc.
+Для длительного прогона: SOAK_CYCLES=5000000 python tests/test_soak.py
+"""
+import gc
+import itertools
+import os
+import sys
+import time
+import tracemalloc
+from http import HTTPStatus
+from types import SimpleNamespace
+
+SOAK_CYCLES = int(os.getenv('SOAK_CYCLES', 10000))
+WARMUP_CYCLES = 1000
+# Допустимый прирост памяти после прогрева, в байтах.
+MAX_TRACED_GROWTH = 256 * 1024
+MAX_RSS_GROWTH = 16 * 1024 * 1024
+
+PAYLOADS = (
+    {'homeworks': [{'homework_name': 'hw', 'status': 'reviewing'}]},
+    {'homeworks': [{'homework_name': 'hw', 'status': 'approved'}]},
+    {'homeworks': []},
+    {'homeworks': [{'homework_name': 'hw', 'status': 'unknown'}]},
+    {'homeworks': {'homework_name': 'hw'}},
+    {},
+    [],
+    None,
+)
+
+
+class SoakFinished(BaseException):
+    """Остановка бесконечного цикла main() после заданного числа итераций."""
+
+
+class StandInResponse:
+
+    def __init__(self, payload, current_date):
+        self.payload = payload
+        self.current_date = current_date
+        self.status_code = (
+            HTTPStatus.INTERNAL_SERVER_ERROR if payload is None
+            else HTTPStatus.OK
+        )
+
+    def json(self):
+        if isinstance(self.payload, dict) and self.payload:
+            return dict(self.payload, current_date=self.current_date)
+        return self.payload
+
+
+class StandInApi:
+
+    def __init__(self):
+        self.payloads = itertools.cycle(PAYLOADS)
+        self.calls = 0
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        self.calls += 1
+        return StandInResponse(next(self.payloads), params['from_date'] + 1)
+
+
+class StandInBot:
+
+    def __init__(self, token=None, **kwargs):
+        self.sent = 0
+
+    def send_message(self, chat_id=None, text=None, **kwargs):
+        self.sent += 1
+
+
+def rss_bytes():
+    """Текущий RSS процесса; 0, если /proc недоступен."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+def run_soak(homework, cycles, on_cycle=None):
+    """Прогон main() на cycles итерациях с виртуальными часами."""
+    counter = itertools.count(1)
+    now = [int(time.time())]
+
+    def sleep(seconds):
+        now[0] += seconds
+        cycle = next(counter)
+        if on_cycle is not None:
+            on_cycle(cycle)
+        if cycle >= cycles:
+            raise SoakFinished
+
+    def clock():
+        return now[0]
+
+    # Подменяется только время основного цикла: пауза сдвигает
+    # виртуальные часы, а time.sleep в фоновых потоках остается настоящим.
+    homework.time = SimpleNamespace(time=clock, monotonic=clock, sleep=sleep)
+    try:
+        homework.main()
+    except SoakFinished:
+        pass
+    finally:
+        homework.time = time
+
+
+def measure_soak(homework, cycles):
+    """
+    Прогон с замерами памяти.
+    Возвращает прирост tracemalloc и RSS между концом прогрева
+    и последней итерацией.
+    """
+    marks = {}
+
+    def on_cycle(cycle):
+        if cycle in (WARMUP_CYCLES, cycles):
+            gc.collect()
+            marks[cycle] = (tracemalloc.take_snapshot(), rss_bytes())
+
+    tracemalloc.start()
+    try:
+        run_soak(homework, cycles, on_cycle)
+    finally:
+        tracemalloc.stop()
+    (before, rss_before), (after, rss_after) = (
+        marks[WARMUP_CYCLES], marks[cycles]
+    )
+    stats = after.compare_to(before, 'lineno')
+    return sum(stat.size_diff for stat in stats), rss_after - rss_before, stats
+
+
+def prepare(homework, api, null_stream, setattr=setattr):
+    """
+    Подмена внешних зависимостей бота локальными заглушками.
+    Логи пишутся в /dev/null и не передаются корневому логгеру,
+    иначе прогон измеряет рост буфера перехватчика логов, а не бота.
+    """
+    setattr(homework.requests, 'get', api.get)
+    setattr(homework.telegram, 'Bot', StandInBot)
+    setattr(homework, 'PRACTICUM_TOKEN', 'token')
+    setattr(homework, 'TELEGRAM_TOKEN', 'token')
+    setattr(homework, 'TELEGRAM_CHAT_ID', 1)
+    setattr(homework, 'HEALTH_PORT', '')
+    setattr(homework, 'TELEGRAM_RATE_LIMIT', 0)
+    setattr(homework, 'OUTBOX_PATH', ':memory:')
+    setattr(homework.WATCHDOG, 'start', lambda interval=10: None)
+    setattr(homework.handler, 'stream', null_stream)
+    setattr(homework.logger, 'propagate', False)
+
+
+def test_main_loop_memory_is_bounded(monkeypatch):
+    import homework
+
+    api = StandInApi()
+    with open(os.devnull, 'w') as null_stream:
+        prepare(homework, api, null_stream, monkeypatch.setattr)
+        traced, rss, stats = measure_soak(homework, SOAK_CYCLES)
+
+    # Часть циклов приходится на паузы после сбоев API.
+    assert api.calls > SOAK_CYCLES // 2
+    assert traced < MAX_TRACED_GROWTH, (
+        f'Память растет по ходу работы цикла: +{traced} байт\n'
+        + '\n'.join(str(stat) for stat in stats[:10])
+    )
+    assert rss < MAX_RSS_GROWTH, f'RSS вырос на {rss} байт'
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    import homework
+
+    api = StandInApi()
+    with open(os.devnull, 'w') as null_stream:
+        prepare(homework, api, null_stream)
+        started = time.perf_counter()
+        traced, rss, stats = measure_soak(homework, SOAK_CYCLES)
+    print(f'{SOAK_CYCLES} циклов за {time.perf_counter() - started:.1f} с, '
+          f'tracemalloc: {traced:+} байт, RSS: {rss:+} байт')
+    for stat in stats[:10]:
+        print(stat)
+    sys.exit(traced >= MAX_TRACED_GROWTH or rss >= MAX_RSS_GROWTH)
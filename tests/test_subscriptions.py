@@ -0,0 +1,270 @@
+from subscriptions import (TokenFanOut, load_subscriptions, pack_messages,
+                           parse_subscriptions)
+from watermark import WatermarkManager
+
+
+def test_parse_subscriptions():
+    result = parse_subscriptions('t1:1, 2;t2:3;;t1:1;broken')
+    assert [(s.token, s.chat_id) for s in result] == [
+        ('t1', '1'), ('t1', '2'), ('t2', '3')
+    ], 'Проверьте разбор строки подписок'
+
+
+def test_load_subscriptions_default():
+    result = load_subscriptions(None, 'token', 42)
+    assert [(s.token, s.chat_id) for s in result] == [('token', 42)], (
+        'Без SUBSCRIPTIONS должна использоваться подписка по умолчанию'
+    )
+
+
+def test_fan_out_polls_each_token_once():
+    calls = []
+
+    def fetch(token, timestamp):
+        calls.append(token)
+        return {'homeworks': [{'homework_name': token, 'status': 'approved'}],
+                'current_date': timestamp + 1}
+
+    renders = []
+
+    def render(homework):
+        renders.append(homework['homework_name'])
+        return homework['homework_name']
+
+    fan_out = TokenFanOut(parse_subscriptions('a:1,2,3;b:4'), fetch,
+                          lambda response: response['homeworks'], render)
+    snapshots = fan_out.poll(WatermarkManager(fan_out.groups, 10, 0))
+
+    assert sorted(calls) == ['a', 'b'], (
+        'Каждый токен должен опрашиваться один раз за цикл'
+    )
+    assert sorted(renders) == ['a', 'b'], (
+        'Сообщение должно формироваться один раз на токен'
+    )
+    assert fan_out.chats('a') == ('1', '2', '3')
+    assert snapshots['a'].current_date == 11
+    assert snapshots['b'].current_date == 11
+    assert snapshots['b'].messages == ('b',)
+
+
+def test_fan_out_announces_every_unseen_homework():
+    homeworks = [
+        {'id': 2, 'homework_name': 'second', 'status': 'approved',
+         'date_updated': '2020-02-14T14:40:57Z'},
+        {'id': 1, 'homework_name': 'first', 'status': 'reviewing',
+         'date_updated': '2020-02-13T14:40:57Z'},
+    ]
+
+    def fetch(token, timestamp):
+        return {'homeworks': homeworks, 'current_date': timestamp}
+
+    fan_out = TokenFanOut(parse_subscriptions('a:1'), fetch,
+                          lambda response: response['homeworks'],
+                          lambda homework: homework['homework_name'])
+    watermarks = WatermarkManager(fan_out.groups, 0, 10 ** 6)
+    snapshot = fan_out.poll_token('a', watermarks)
+    assert snapshot.messages == ('first\nsecond',), (
+        'Все изменения за окно опроса должны попасть в сообщения '
+        'в порядке изменения'
+    )
+    watermarks.commit('a', snapshot.homeworks, snapshot.current_date)
+    assert fan_out.poll_token('a', watermarks).messages == ()
+
+
+def test_pack_messages_respects_limit():
+    assert pack_messages(['ab', 'cd', 'e'], limit=5) == ('ab\ncd', 'e')
+    assert pack_messages(['abcdefg'], limit=3) == ('abc', 'def', 'g')
+    assert pack_messages([]) == ()
+
+
+def test_fan_out_isolates_token_errors():
+    def fetch(token, timestamp):
+        if token == 'bad':
+            raise ValueError(token)
+        return {'homeworks': [], 'current_date': timestamp}
+
+    fan_out = TokenFanOut(parse_subscriptions('bad:1;good:2'), fetch,
+                          lambda response: response['homeworks'], str)
+    snapshots = fan_out.poll(WatermarkManager(fan_out.groups, 0, 0))
+
+    assert isinstance(snapshots['bad'].error, ValueError)
+    assert snapshots['good'].error is None
+    assert snapshots['good'].messages == ()
+
+
+def test_error_notices_are_tracked_per_token(monkeypatch):
+    import itertools
+
+    import homework
+    from delivery import DeliveryExecutor
+    from exceptions import NotFoundError
+    from isolation import IsolatedPoller
+    from notifiers import Notifier
+    from outbox import Outbox
+    from scheduler import PollScheduler
+
+    class ListNotifier(Notifier):
+
+        def __init__(self):
+            self.sent = []
+
+        def send(self, chat_id, text):
+            self.sent.append((chat_id, text))
+
+    def homework_response(status, date):
+        return {'homeworks': [{'id': 1, 'homework_name': 'hw',
+                               'status': status, 'date_updated': date}]}
+
+    responses = {}
+
+    def fetch(token, from_date):
+        response = responses[token]
+        if isinstance(response, Exception):
+            raise response
+        return dict(response, current_date=from_date + 1)
+
+    monkeypatch.setattr(homework, 'EXCEPTIONS', {})
+    monkeypatch.setattr(homework.logger, 'disabled', True)
+    fan_out = TokenFanOut(parse_subscriptions('a:1;b:2'), fetch,
+                          homework.check_response, homework.parse_status)
+    watermarks = WatermarkManager(fan_out.groups, 0, 0)
+    clock = itertools.count(step=10 ** 5).__next__
+    scheduler = PollScheduler(fan_out.groups, clock=clock)
+    poller = IsolatedPoller(
+        lambda token: fan_out.poll_token(token, watermarks), inline=True,
+        clock=clock
+    )
+    notifier = ListNotifier()
+    delivery = DeliveryExecutor(notifier, retries=0)
+    outbox = Outbox(':memory:')
+
+    def cycle(a, b):
+        responses.update(a=a, b=b)
+        notifier.sent.clear()
+        homework.process_cycle(delivery, fan_out, watermarks, scheduler,
+                               poller, outbox)
+        return sorted(chat_id for chat_id, _ in notifier.sent)
+
+    try:
+        down = NotFoundError('Не удалось подключиться к API.')
+        assert cycle(down, down) == ['1', '2'], (
+            'Об ошибке своего токена должны узнать чаты каждой подписки'
+        )
+        assert cycle(down, down) == []
+        empty = {'homeworks': []}
+        assert cycle(homework_response('reviewing', '2020-02-13T14:40:57Z'),
+                     empty) == ['1', '2']
+        assert cycle(homework_response('approved', '2020-02-14T14:40:57Z'),
+                     empty) == ['1'], (
+            'Новый статус одного токена не должен повторять "нет '
+            'обновлений" для другого'
+        )
+    finally:
+        delivery.shutdown()
+        outbox.close()
+
+
+def test_error_notices_are_published_outside_state_lock(monkeypatch):
+    import threading
+
+    import homework
+    from exceptions import NotFoundError
+    from isolation import IsolatedPoller
+    from outbox import Outbox
+    from scheduler import PollScheduler
+
+    responses = {}
+
+    def fetch(token, from_date):
+        response = responses[token]
+        if isinstance(response, Exception):
+            raise response
+        return dict(response, current_date=from_date + 1)
+
+    monkeypatch.setattr(homework, 'EXCEPTIONS', {})
+    monkeypatch.setattr(homework.logger, 'disabled', True)
+    fan_out = TokenFanOut(parse_subscriptions('a:1;b:2'), fetch,
+                          homework.check_response, homework.parse_status)
+    watermarks = WatermarkManager(fan_out.groups, 0, 0)
+    scheduler = PollScheduler(fan_out.groups, clock=lambda: 0)
+    poller = IsolatedPoller(
+        lambda token: fan_out.poll_token(token, watermarks), inline=True,
+        clock=lambda: 0
+    )
+    state_lock = threading.Lock()
+    published = []
+
+    def publish(chat_ids, messages, state):
+        published.append((list(chat_ids), state is None,
+                          state_lock.locked()))
+
+    responses.update(a=NotFoundError('Не удалось подключиться к API.'),
+                     b={'homeworks': [{
+                         'id': 1, 'homework_name': 'hw',
+                         'status': 'approved',
+                         'date_updated': '2020-02-13T14:40:57Z',
+                     }]})
+    outbox = Outbox(':memory:')
+    try:
+        homework.process_cycle(None, fan_out, watermarks, scheduler, poller,
+                               outbox, publish, state_lock)
+    finally:
+        outbox.close()
+    assert sorted(published) == [(['1'], True, False), (['2'], False, True)], (
+        'Уведомление об ошибке должно уходить через publish без '
+        'state_lock, а статус - вместе с отметкой под ним'
+    )
+
+
+def test_unknown_status_does_not_stall_token(monkeypatch):
+    import itertools
+
+    import homework
+    from isolation import IsolatedPoller
+    from outbox import Outbox
+    from scheduler import PollScheduler
+
+    homeworks = [{'id': 1, 'homework_name': 'odd', 'status': 'unknown',
+                  'date_updated': '2020-02-13T14:40:57Z'}]
+    dates = []
+
+    def fetch(token, from_date):
+        dates.append(from_date)
+        return {'homeworks': list(homeworks), 'current_date': from_date + 1}
+
+    monkeypatch.setattr(homework, 'EXCEPTIONS', {})
+    monkeypatch.setattr(homework.logger, 'disabled', True)
+    fan_out = TokenFanOut(parse_subscriptions('a:1'), fetch,
+                          homework.check_response, homework.parse_status)
+    watermarks = WatermarkManager(fan_out.groups, 0, 10 ** 6)
+    clock = itertools.count(step=10 ** 5).__next__
+    scheduler = PollScheduler(fan_out.groups, clock=clock)
+    poller = IsolatedPoller(
+        lambda token: fan_out.poll_token(token, watermarks), inline=True,
+        clock=clock
+    )
+    published = []
+
+    def cycle():
+        published.clear()
+        homework.process_cycle(None, fan_out, watermarks, scheduler, poller,
+                               outbox, lambda chat_ids, messages, state:
+                               published.extend(messages))
+        return list(published)
+
+    outbox = Outbox(':memory:')
+    try:
+        notices = cycle()
+        assert len(notices) == 1 and 'unknown' in notices[0], (
+            'О неизвестном статусе нужно сообщить один раз'
+        )
+        homeworks.insert(0, {'id': 2, 'homework_name': 'hw',
+                             'status': 'approved',
+                             'date_updated': '2020-02-14T14:40:57Z'})
+        assert cycle() == [homework.parse_status(homeworks[0])], (
+            'Работа с неизвестным статусом не должна мешать сообщать '
+            'об остальных'
+        )
+        assert dates[1] > dates[0], 'Окно запроса должно сдвигаться'
+    finally:
+        outbox.close()
@@ -0,0 +1,47 @@
+from watermark import Watermark, parse_date
+
+HOMEWORK = {'id': 1, 'homework_name': 'hw', 'status': 'reviewing',
+            'date_updated': '2020-02-13T14:40:57Z'}
+UPDATED = 1581604857
+
+
+def test_parse_date():
+    assert parse_date(HOMEWORK['date_updated']) == UPDATED
+    assert parse_date(None) is None
+    assert parse_date('вчера') is None
+    assert parse_date('2020-02-13 14:40:57Z') is None
+    assert parse_date('2020-02-30T14:40:57Z') is None
+
+
+def test_watermark_overlap_and_dedup():
+    watermark = Watermark(start=UPDATED - 1000, overlap=60)
+    assert watermark.from_date() == UPDATED - 1060
+
+    assert watermark.unseen([HOMEWORK]) == [HOMEWORK]
+    watermark.commit([HOMEWORK])
+    assert watermark.mark == UPDATED
+    assert watermark.from_date() == UPDATED - 60, (
+        'Окно запроса должно начинаться с перекрытием от отметки'
+    )
+    assert watermark.unseen([HOMEWORK]) == [], (
+        'Уже обработанное изменение из зоны перекрытия нужно отбрасывать'
+    )
+    approved = dict(HOMEWORK, status='approved',
+                    date_updated='2020-02-13T14:41:57Z')
+    assert watermark.unseen([approved, HOMEWORK]) == [approved]
+
+
+def test_watermark_is_monotonic_without_current_date():
+    watermark = Watermark(start=UPDATED, overlap=60)
+    watermark.commit([], current_date=None)
+    assert watermark.mark == UPDATED, (
+        'Без current_date отметка не должна сдвигаться'
+    )
+    watermark.commit([dict(HOMEWORK, date_updated='2019-01-01T00:00:00Z')],
+                     current_date=UPDATED - 10)
+    assert watermark.mark == UPDATED, 'Отметка не должна уменьшаться'
+    watermark.commit([], current_date=UPDATED + 600)
+    assert watermark.mark == UPDATED + 600
+    assert not watermark.seen, (
+        'Изменения старше окна запроса не должны храниться'
+    )
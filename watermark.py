@@ -0,0 +1,122 @@
+"""
+Инкрементальные окна опроса API.
+Для каждой подписки хранится монотонная отметка (high-water mark):
+максимум из date_updated полученных работ и current_date ответа API.
+Запрос идет с небольшим перекрытием от отметки, а работы из зоны
+перекрытия, которые уже были обработаны, отбрасываются.
+"""
+from datetime import datetime, timezone
+
+# Формат date_updated в ответе API: '2020-02-13T14:40:57Z'.
+DATE_LENGTH = 20
+
+
+def parse_date(value):
+    """
+    Перевод date_updated из ответа API в unix-время; None при ошибке.
+    Дата разбирается для каждой работы в каждом цикле, поэтому вместо
+    strptime используется fromisoformat после проверки формы строки:
+    он быстрее на порядок.
+    """
+    if (not isinstance(value, str) or len(value) != DATE_LENGTH
+            or value[10] != 'T' or value[-1] != 'Z'):
+        return None
+    try:
+        return int(datetime.fromisoformat(value[:-1])
+                   .replace(tzinfo=timezone.utc).timestamp())
+    except ValueError:
+        return None
+
+
+def homework_key(homework):
+    """Ключ изменения статуса работы для отсеивания повторов."""
+    return (homework.get('id', homework.get('homework_name')),
+            homework.get('status'), homework.get('date_updated'))
+
+
+class Watermark:
+    """
+    Отметка одной подписки.
+    seen хранит ключи уже обработанных изменений вместе с их датой
+    и очищается от всего, что старше текущего окна, поэтому его
+    размер ограничен числом изменений внутри перекрытия.
+    """
+
+    __slots__ = ('mark', 'overlap', 'seen')
+
+    def __init__(self, start, overlap):
+        self.mark = start
+        self.overlap = overlap
+        self.seen = {}
+
+    def from_date(self):
+        """Начало следующего окна запроса."""
+        return max(0, self.mark - self.overlap)
+
+    def unseen(self, homeworks):
+        """Работы, изменения которых еще не обработаны."""
+        return [homework for homework in homeworks
+                if homework_key(homework) not in self.seen]
+
+    def commit(self, homeworks, current_date=None):
+        """
+        Учет обработанных работ и сдвиг отметки.
+        Отметка только растет: без current_date она сдвигается лишь
+        по date_updated работ, поэтому окно не может быть пропущено.
+        """
+        for homework in homeworks:
+            date = parse_date(homework.get('date_updated'))
+            self.seen[homework_key(homework)] = (
+                self.mark if date is None else date
+            )
+            if date is not None and date > self.mark:
+                self.mark = date
+        if isinstance(current_date, int) and current_date > self.mark:
+            self.mark = current_date
+        from_date = self.from_date()
+        for key, date in list(self.seen.items()):
+            if date < from_date:
+                del self.seen[key]
+
+    def dump(self):
+        """Состояние отметки для сохранения в журнал."""
+        return {'mark': self.mark,
+                'seen': [[*key, date] for key, date in self.seen.items()]}
+
+    def restore(self, state):
+        """Восстановление отметки из сохраненного состояния."""
+        self.mark = state['mark']
+        self.seen = {tuple(item[:-1]): item[-1] for item in state['seen']}
+
+
+class WatermarkManager:
+    """Отметки всех подписок, по одной на токен."""
+
+    def __init__(self, tokens, start, overlap):
+        self.watermarks = {token: Watermark(start, overlap)
+                           for token in tokens}
+
+    def from_date(self, token):
+        """Начало окна запроса для токена."""
+        return self.watermarks[token].from_date()
+
+    def unseen(self, token, homeworks):
+        """Необработанные работы токена."""
+        return self.watermarks[token].unseen(homeworks)
+
+    def commit(self, token, homeworks, current_date=None):
+        """Учет обработанных работ токена."""
+        self.watermarks[token].commit(homeworks, current_date)
+
+    def dump(self, token):
+        """Состояние отметки токена для сохранения в журнал."""
+        return self.watermarks[token].dump()
+
+    def restore(self, token, state):
+        """Восстановление отметки токена."""
+        self.watermarks[token].restore(state)
+
+    def marks(self):
+        """Текущие отметки по токенам."""
+        return {token: watermark.mark
+                for token, watermark in self.watermarks.items()}